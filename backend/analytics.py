@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import time
+from collections import Counter
+
+import orjson
+from cache import SQLiteDatabase, data_path, normalize_name
+from dotenv import load_dotenv
+from publication import Publication
+from utils import name_matcher
+
+load_dotenv()
+
+TOP_COAUTHORS = 20
+# Citation rows of the Scholar profile kept from its `cited_by` table.
+CITATIONS = ("citations", "h_index", "i10_index")
+
+
+def match_key(name: str) -> str:
+    """First initial and last name, the common denominator of how sources spell an author."""
+    parts = normalize_name(name).split()
+    if len(parts) < 2:
+        return " ".join(parts)
+    return f"{parts[0][0]} {parts[-1]}"
+
+
+class Analytics(SQLiteDatabase):
+    """Per-author metrics and the collaboration graph between queried authors, precomputed as results land.
+
+    Updating an author recounts their own publications and rewrites only their edges, found through
+    indexed lookups of co-author names, so views read stored rows and never pair up authors themselves.
+    Two queried authors are linked when either lists the other as a co-author, weighted by the number
+    of shared publications.
+    """
+
+    def setup(self, conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS authors (
+                author_key TEXT PRIMARY KEY, match_key TEXT, author TEXT, affiliation TEXT, publications INTEGER,
+                by_year TEXT, by_source TEXT, citations TEXT, updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS authors_match ON authors (match_key);
+            CREATE INDEX IF NOT EXISTS authors_affiliation ON authors (affiliation);
+            CREATE TABLE IF NOT EXISTS coauthors (author_key TEXT, coauthor_key TEXT, name TEXT, count INTEGER, PRIMARY KEY (author_key, coauthor_key)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS coauthors_coauthor ON coauthors (coauthor_key, author_key);
+            CREATE TABLE IF NOT EXISTS edges (a TEXT, b TEXT, weight INTEGER, PRIMARY KEY (a, b)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS edges_b ON edges (b);
+        """)
+
+    def update(self, author: str, records: list[Publication], affiliation: str = None, info: dict = None):
+        """Recompute the metrics and collaborations of an author from their latest deduplicated publications."""
+        key, own = normalize_name(author), match_key(author)
+        by_year = Counter(record.year for record in records if record.year)
+        by_source = Counter(source for record in records for source in record.sources or [record.source])
+
+        # Each publication counts once per co-author, however many spellings it lists them under.
+        spellings = list({name for record in records for name in record.authors})
+        own_names = {name for name, hit in zip(spellings, name_matcher(author).match_many([[name] for name in spellings])) if hit}
+        names, counts = {}, Counter()
+        for record in records:
+            seen = set()
+            for name in record.authors:
+                coauthor = match_key(name)
+                if coauthor and coauthor != own and coauthor not in seen and name not in own_names:
+                    seen.add(coauthor)
+                    names.setdefault(coauthor, Counter())[name] += 1
+            counts.update(seen)
+        citations = {name: info[name] for name in CITATIONS if name in info} | {"graph": info.get("graph")} if info else None
+
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            # Without a Scholar profile this time, e.g. SerpAPI failed or a refresh skipped it, the last known citations stay.
+            self.conn.execute(
+                "INSERT OR REPLACE INTO authors VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, (SELECT citations FROM authors WHERE author_key = ?), 'null'), ?)",
+                (
+                    key, own, author, affiliation, len(records), orjson.dumps(by_year, option=orjson.OPT_NON_STR_KEYS).decode(),
+                    orjson.dumps(by_source).decode(), orjson.dumps(citations).decode() if citations else None, key, time.time(),
+                ),
+            )
+            self.conn.execute("DELETE FROM coauthors WHERE author_key = ?", (key,))
+            self.conn.executemany(
+                "INSERT INTO coauthors VALUES (?, ?, ?, ?)",
+                [(key, coauthor, names[coauthor].most_common(1)[0][0], count) for coauthor, count in counts.items()],
+            )
+
+            self.conn.execute("DELETE FROM edges WHERE a = ? OR b = ?", (key, key))
+            # Queried authors this one lists, and queried authors listing this one.
+            weights = Counter()
+            for other, count in self.conn.execute(
+                "SELECT a.author_key, c.count FROM coauthors c JOIN authors a ON a.match_key = c.coauthor_key WHERE c.author_key = ? AND a.author_key != ?",
+                (key, key),
+            ):
+                weights[other] = max(weights[other], count)
+            for other, count in self.conn.execute("SELECT author_key, count FROM coauthors WHERE coauthor_key = ? AND author_key != ?", (own, key)):
+                weights[other] = max(weights[other], count)
+            self.conn.executemany("INSERT INTO edges VALUES (?, ?, ?)", [(min(key, other), max(key, other), weight) for other, weight in weights.items()])
+
+    def author(self, author: str) -> dict:
+        """Stored metrics of an author, or None if they were never queried."""
+        key = normalize_name(author)
+        row = self.conn.execute(
+            "SELECT author, affiliation, publications, by_year, by_source, citations, updated FROM authors WHERE author_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        name, affiliation, publications, by_year, by_source, citations, updated = row
+        coauthors = self.conn.execute(
+            "SELECT name, count FROM coauthors WHERE author_key = ? ORDER BY count DESC, name LIMIT ?", (key, TOP_COAUTHORS)
+        ).fetchall()
+        collaborators = self.conn.execute(
+            "SELECT a.author, e.weight FROM edges e JOIN authors a ON a.author_key = CASE WHEN e.a = ? THEN e.b ELSE e.a END"
+            " WHERE e.a = ? OR e.b = ? ORDER BY e.weight DESC, a.author",
+            (key, key, key),
+        ).fetchall()
+        return {
+            "author": name,
+            "affiliation": affiliation,
+            "publications": publications,
+            "by_year": orjson.loads(by_year),
+            "by_source": orjson.loads(by_source),
+            "citations": orjson.loads(citations),
+            "coauthors": [{"name": name, "count": count} for name, count in coauthors],
+            "collaborators": [{"author": name, "weight": weight} for name, weight in collaborators],
+            "updated": updated,
+        }
+
+    def graph(self, affiliation: str = None, min_weight: int = 1) -> dict:
+        """Collaboration graph between the queried authors, of one affiliation or of all of them."""
+        where, params = ("WHERE affiliation = ?", [affiliation]) if affiliation else ("", [])
+        nodes = self.conn.execute(f"SELECT author_key, author, affiliation, publications FROM authors {where} ORDER BY author_key", params).fetchall()
+        edges = self.conn.execute(
+            f"SELECT e.a, e.b, e.weight FROM edges e JOIN authors x ON x.author_key = e.a JOIN authors y ON y.author_key = e.b"
+            f" WHERE e.weight >= ? {'AND x.affiliation = ? AND y.affiliation = ?' if affiliation else ''} ORDER BY e.a, e.b",
+            [min_weight] + params * 2,
+        ).fetchall()
+        return {
+            "nodes": [{"id": key, "author": author, "affiliation": affiliation, "publications": publications} for key, author, affiliation, publications in nodes],
+            "edges": [{"source": a, "target": b, "weight": weight} for a, b, weight in edges],
+        }
+
+    def stats(self) -> dict:
+        authors, edges = self.conn.execute("SELECT (SELECT COUNT(*) FROM authors), (SELECT COUNT(*) FROM edges)").fetchone()
+        return {"authors": authors, "edges": edges}
+
+
+analytics = Analytics(os.getenv("ANALYTICS_PATH") or data_path("analytics.db"))
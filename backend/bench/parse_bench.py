@@ -0,0 +1,51 @@
+"""Micro-benchmark of the lxml XPath extractors against the BeautifulSoup ones.
+
+Runs both on the saved pages in fixtures/pages and checks that they extract the same text.
+
+    python bench/parse_bench.py [-n 50] [--pages fixtures/pages]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import ABSTRACT_SPECS, PAPER_SPECS, parse_paper, soup_abstract, soup_paper, xpath_abstract  # noqa: E402
+from utils import clean_abs  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(label: str, soup, fast, number: int):
+    soup_result, fast_result = soup(), fast()
+    soup_time = timeit.timeit(soup, number=number) / number * 1000
+    fast_time = timeit.timeit(fast, number=number) / number * 1000
+    match = "yes" if soup_result == fast_result else "NO"
+    print(f"{label:<20}{soup_time:>10.2f}{fast_time:>10.2f}{soup_time / fast_time:>9.1f}x{match:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=50)
+    parser.add_argument("--pages", default=os.path.join(BACKEND, "fixtures", "pages"))
+    args = parser.parse_args()
+
+    print(f"{'page':<20}{'soup ms':>10}{'lxml ms':>10}{'speedup':>10}{'same':>7}")
+    for source, spec in ABSTRACT_SPECS.items():
+        path = os.path.join(args.pages, f"{source}.html")
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        run(source, lambda: clean_abs(soup_abstract(source, raw)), lambda: clean_abs(xpath_abstract(spec, raw)), args.number)
+
+    for source in PAPER_SPECS:
+        with open(os.path.join(args.pages, f"{source}.html"), "rb") as f:
+            raw = f.read()
+        run(f"{source} (paper)", lambda: soup_paper(source, raw), lambda: parse_paper(source, raw), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Stand-in server replaying recorded responses of every source, for benchmarks without live sites.
+
+Requests are expected as `/<host>/<path>?<query>`, which is what `scheduler.fetch` sends when
+`REPLAY_URL` points at this server. Listing responses come from fixtures/replay and paper pages from
+fixtures/pages, with the queried author substituted in so that name matching behaves as it would live.
+Every response carries an ETag and Last-Modified, and conditional requests for unchanged bodies get a
+304 like they would from dblp or arXiv.
+
+    python bench/replay.py [--port 8808] [--latency 0.05] [--latency www.nature.com=0.4] [--error-rate 0.01]
+
+GET /_stats returns the number of requests, 304s, body bytes and injected errors per host, POST /_reset
+zeroes them.
+"""
+
+import argparse
+import asyncio
+import html
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from collections import Counter
+from string import Template
+from urllib.parse import quote, unquote
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import source_map  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(BACKEND, "fixtures")
+
+# Author and title the pages in fixtures/pages were saved with.
+PAGE_AUTHOR = "Jane Doe"
+PAGE_AUTHOR_REVERSED = "Doe, Jane"
+PAGE_TITLE = "Scalable Graph Learning for Protein Structure"
+
+CONTENT_TYPES = {".json": "application/json", ".xml": "application/xml", ".html": "text/html"}
+# Fixtures don't change while the server runs, every body claims the same modification time.
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def load(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def escape(value: str, kind: str) -> str:
+    if kind == ".json":
+        return json.dumps(value)[1:-1]
+    return html.escape(value)
+
+
+class Replay:
+    """Routes `(host, path)` to a fixture and renders it for the author found in the request."""
+
+    def __init__(self, latency: dict, error_rate: dict, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.errors = Counter()
+        self.not_modified = Counter()
+        self.bytes = Counter()
+        self.titles = load("replay/titles.txt").split("\n")[:-1]
+        self.routes = [
+            ("serpapi.com", r"/search\.json", self.serpapi),
+            ("dblp.org", r"/search/author/api", lambda r, m: self.listing("dblp_search.json", r.query["q"])),
+            ("dblp.org", r"/pid/\d+/(?P<author>.+)\.xml", lambda r, m: self.listing("dblp_person.xml", m["author"])),
+            ("export.arxiv.org", r"/api/query", lambda r, m: self.listing("arxiv.xml", r.query["search_query"].removeprefix("au:"))),
+            ("pubmed.ncbi.nlm.nih.gov", r"/", lambda r, m: self.listing("pubmed_search.html", re.match(r"\((.*)\[Author\]", r.query["term"])[1])),
+            ("inspirehep.net", r"/api/literature", lambda r, m: self.listing("inspire_search.json", r.query["q"].removeprefix("a:").split(" and ")[0])),
+            ("inspirehep.net", r"/api/literature/(?P<id>\d+)", lambda r, m: self.paper("pages/inspire.json", r.query["author"], int(m["id"][-2:]))),
+            ("dl.acm.org", r"/action/doSearch", lambda r, m: self.listing("acmdl_search.html", r.query["text1"])),
+            ("www.biorxiv.org", r"/search/.*author1:(?P<author>.+?) jcode:.*", lambda r, m: self.listing("biorxiv_search.html", m["author"])),
+            ("www.biorxiv.org", r"/content/10\.1101/(?P<author>.+)/(?P<n>\d+)", lambda r, m: self.paper("pages/biorxiv.html", m["author"], int(m["n"]))),
+            ("www.nature.com", r"/search", lambda r, m: self.listing("nature_search.html", r.query["author"])),
+            ("www.nature.com", r"/articles/(?P<author>.+)/s41586-(?P<n>\d+)", lambda r, m: self.paper("pages/nature.html", m["author"], int(m["n"]))),
+        ]
+
+    def listing(self, name: str, author: str):
+        kind = os.path.splitext(name)[1]
+        values = {
+            "author": escape(author, kind),
+            "slug": quote(author, safe=""),
+            "seed": str(zlib.crc32(author.encode()) % 1_000_000),
+        }
+        return Template(load(f"replay/{name}")).safe_substitute(values), CONTENT_TYPES[kind]
+
+    def paper(self, name: str, author: str, n: int):
+        kind = os.path.splitext(name)[1]
+        last, _, first = author.rpartition(" ")
+        body = load(name)
+        body = body.replace(PAGE_TITLE, escape(self.titles[n % len(self.titles)], kind))
+        body = body.replace(PAGE_AUTHOR_REVERSED, escape(f"{first}, {last}" if last else author, kind))
+        body = body.replace(PAGE_AUTHOR, escape(author, kind))
+        return body, CONTENT_TYPES[kind]
+
+    def serpapi(self, request: web.Request, match):
+        if request.query.get("engine") == "google_scholar_profiles":
+            return self.listing("serpapi_profiles.json", request.query["mauthors"])
+        # Profile ids are the url-quoted author, see serpapi_profiles.json.
+        return self.listing("serpapi_author.json", unquote(request.query["author_id"]))
+
+    def landing(self, host: str):
+        # Paper pages linked from listings, e.g. arxiv.org/abs/..., returned as saved.
+        source = source_map.get(host)
+        path = os.path.join(FIXTURES, "pages", f"{source}.html")
+        if source and os.path.exists(path):
+            return load(f"pages/{source}.html"), "text/html"
+        return None
+
+    def pick(self, table: dict, host: str) -> float:
+        return table.get(host, table.get(None, 0))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        host, path = request.match_info["host"], "/" + request.match_info["path"]
+        self.requests[host] += 1
+
+        if latency := self.pick(self.latency, host):
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * latency)
+        if self.random.random() < self.pick(self.error_rate, host):
+            self.errors[host] += 1
+            return web.Response(status=503, text="Injected error")
+
+        for route_host, pattern, handler in self.routes:
+            if route_host == host and (match := re.fullmatch(pattern, path)):
+                break
+        else:
+            match, handler = None, lambda r, m: self.landing(host)
+
+        try:
+            result = handler(request, match)
+        except KeyError:
+            result = None
+        if result is None:
+            return web.Response(status=404, text="No recording for this request")
+        body, content_type = result
+        body = body.encode()
+        etag = f'"{zlib.crc32(body):08x}"'
+        if request.headers.get("If-None-Match") == etag or (not request.headers.get("If-None-Match") and request.headers.get("If-Modified-Since") == LAST_MODIFIED):
+            self.not_modified[host] += 1
+            return web.Response(status=304, headers={"ETag": etag, "Last-Modified": LAST_MODIFIED})
+        self.bytes[host] += len(body)
+        return web.Response(body=body, content_type=content_type, charset="utf-8", headers={"ETag": etag, "Last-Modified": LAST_MODIFIED})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": self.requests,
+            "errors": self.errors,
+            "not_modified": self.not_modified,
+            "bytes": self.bytes,
+            "total": sum(self.requests.values()),
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.requests.clear()
+        self.errors.clear()
+        self.not_modified.clear()
+        self.bytes.clear()
+        return web.json_response({"status": "ok"})
+
+
+def create_app(latency: dict = None, error_rate: dict = None, seed: int = None) -> web.Application:
+    """`latency` (mean seconds) and `error_rate` map hosts to values, with `None` as the default."""
+    replay = Replay(latency or {}, error_rate or {}, seed)
+    app = web.Application()
+    app.add_routes([
+        web.get("/_stats", replay.stats),
+        web.post("/_reset", replay.reset),
+        web.route("*", "/{host}/{path:.*}", replay.handle),
+    ])
+    app["replay"] = replay
+    return app
+
+
+def per_host(values: list[str]) -> dict:
+    """`["0.05", "dblp.org=0.5"]` -> `{None: 0.05, "dblp.org": 0.5}`."""
+    table = {}
+    for value in values or []:
+        host, _, number = value.rpartition("=")
+        table[host or None] = float(number)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", action="append", help="mean seconds per response, optionally HOST=SECONDS")
+    parser.add_argument("--error-rate", action="append", help="share of requests answered with a 503, optionally HOST=RATE")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    web.run_app(create_app(per_host(args.latency), per_host(args.error_rate), args.seed), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""End to end benchmark of `scraper.multimain` against the replay server in bench/replay.py.
+
+Starts the replay server, points the scrapers at it through REPLAY_URL and scrapes batches of 1, 10
+and 100 made-up authors with cold caches, reporting throughput, per-author latency, peak Python
+memory and the number of outbound requests per batch.
+
+With `--passes 2` every batch is scraped again after its first pass, with the result and abstract
+caches emptied but the ETag/Last-Modified validators kept, which is what a scheduled refresh costs.
+
+    python bench/scrape_bench.py [--authors 1 10 100] [--passes 2] [--latency 0.05] [--error-rate 0.01] [--rate-limit]
+
+Save a run with `--save baseline.json` and check a later one with `--compare baseline.json`; the
+script exits with status 1 when throughput, p99 latency or request count regressed by more than
+`--tolerance`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import aiohttp
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+FIRST = ["Jane", "Arjun", "Mei", "Carlos", "Fatima", "Olga", "Kwame", "Sofia", "Hiroshi", "Amara"]
+LAST = ["Doe", "Raman", "Chen", "Alvarez", "Haddad", "Petrova", "Mensah", "Rossi", "Tanaka", "Okafor"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def wait_for(url: str, timeout: float = 30):
+    end = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url + "/_stats") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                if time.monotonic() > end:
+                    raise
+            await asyncio.sleep(0.1)
+
+
+async def replay_request(url: str, method: str = "GET") -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.request(method, url) as response:
+            return await response.json()
+
+
+async def run(sizes: list[int], functions: list, deadline: float, url: str, passes: int = 1) -> list[dict]:
+    import cache
+    import revalidation
+    import scraper
+    import serpapi
+    from scheduler import create_session
+
+    latencies = []
+    scrape = scraper.main
+
+    async def timed_main(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await scrape(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    scraper.main = timed_main
+    authors = [f"{first} {last}" for last in LAST for first in FIRST]
+    reports = []
+    for size in sizes:
+        batch = [authors[i % len(authors)] + (f" {i // len(authors) + 1}" if i >= len(authors) else "") for i in range(size)]
+        revalidation.validators.clear()
+        for number in range(1, passes + 1):
+            cache.result_cache.memory.clear()
+            cache.abstract_cache.memory.clear()
+            serpapi.serpapi.memory.clear()
+            latencies.clear()
+            await replay_request(url + "/_reset", "POST")
+            tracemalloc.reset_peak()
+
+            start = time.perf_counter()
+            async with create_session() as session:
+                results = await scraper.multimain(batch, session=session, deadline=deadline, functions=functions)
+            elapsed = time.perf_counter() - start
+
+            stats = await replay_request(url + "/_stats")
+            statuses = [state for result in results.values() for name, state in result["status"].items() if name != "abstracts"]
+            reports.append({
+                "authors": size,
+                "pass": number,
+                "seconds": round(elapsed, 3),
+                "authors_per_second": round(size / elapsed, 3),
+                "p50": round(percentile(latencies, 0.5), 3),
+                "p99": round(percentile(latencies, 0.99), 3),
+                "peak_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 1),
+                "requests": stats["total"],
+                "not_modified": sum(stats["not_modified"].values()),
+                "kb": round(sum(stats["bytes"].values()) / 1024),
+                "injected_errors": sum(stats["errors"].values()),
+                "records": sum(len(result["data"]) for result in results.values()),
+                "sources_ok": round(statuses.count("ok") / len(statuses), 3) if statuses else 0.0,
+            })
+    return reports
+
+
+def compare(reports: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    regressions = []
+    previous = {(report["authors"], report.get("pass", 1)): report for report in baseline}
+    for report in reports:
+        if (old := previous.get((report["authors"], report["pass"]))) is None:
+            continue
+        if report["authors_per_second"] < old["authors_per_second"] * (1 - tolerance):
+            regressions.append(f"{report['authors']} authors: throughput {old['authors_per_second']} -> {report['authors_per_second']}/s")
+        if report["p99"] > old["p99"] * (1 + tolerance):
+            regressions.append(f"{report['authors']} authors: p99 {old['p99']} -> {report['p99']}s")
+        if report["requests"] > old["requests"] * (1 + tolerance):
+            regressions.append(f"{report['authors']} authors: requests {old['requests']} -> {report['requests']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--authors", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--passes", type=int, default=1, help="scrape every batch this many times, keeping HTTP validators")
+    parser.add_argument("--sources", nargs="+", default=["dblp", "arxiv", "pubmed", "inspire", "acmdl", "biorxiv", "nature"])
+    parser.add_argument("--latency", action="append", default=None, help="passed on to bench/replay.py")
+    parser.add_argument("--error-rate", action="append", default=None, help="passed on to bench/replay.py")
+    parser.add_argument("--deadline", type=float, default=None)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the per-host rate limits of the live sites")
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, os.path.join(BACKEND, "bench", "replay.py"), "--port", str(port), "--seed", "15"]
+    for value in args.latency or ["0.05"]:
+        command += ["--latency", value]
+    for value in args.error_rate or []:
+        command += ["--error-rate", value]
+
+    # Before anything imports scheduler or cache, which read these at import time.
+    os.environ["REPLAY_URL"] = url
+    os.environ["CACHE_BACKEND"] = "memory"
+    # Replayed searches are free, and 100 authors alone need more than a day's budget.
+    os.environ["SERPAPI_DAILY_BUDGET"] = "0"
+    # Keep what finished authors are stored into out of the working directory.
+    scratch = tempfile.mkdtemp(prefix="scrape_bench")
+    for name, path in [("VALIDATORS_PATH", "validators.db"), ("CATALOG_PATH", "publications.db"), ("ANALYTICS_PATH", "analytics.db"), ("SEMANTIC_PATH", "semantic")]:
+        os.environ[name] = os.path.join(scratch, path)
+
+    import scheduler
+    import scraper
+
+    if not args.rate_limit:
+        scheduler.scheduler.rates = {host: 10_000 for host in scheduler.HOST_RATES}
+        scheduler.DEFAULT_RATE = 10_000
+    functions = [getattr(scraper, name) for name in args.sources]
+
+    server = subprocess.Popen(command)
+    try:
+        asyncio.run(wait_for(url))
+        tracemalloc.start()
+        reports = asyncio.run(run(args.authors, functions, args.deadline, url, args.passes))
+    finally:
+        server.terminate()
+        server.wait()
+
+    columns = ["authors", "pass", "seconds", "authors_per_second", "p50", "p99", "peak_mb", "requests", "not_modified", "kb", "injected_errors", "records", "sources_ok"]
+    print("".join(f"{column:>19}" for column in columns))
+    for report in reports:
+        print("".join(f"{report[column]:>19}" for column in columns))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(reports, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(reports, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
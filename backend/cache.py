@@ -0,0 +1,370 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+import orjson
+from dotenv import load_dotenv
+from instrumentation import abstract_seconds, cache_total, span
+from utils import abstract, generate_variants
+
+load_dotenv()
+
+# Seconds each source's results stay fresh. Scholar profiles change slowly and cost SerpAPI quota,
+# preprint servers pick up new papers more often.
+SOURCE_TTL = {
+    "scholar": 7 * 24 * 3600,
+    "dblp": 3 * 24 * 3600,
+    "acmdl": 3 * 24 * 3600,
+    "pubmed": 24 * 3600,
+    "inspire": 24 * 3600,
+    "nature": 24 * 3600,
+    "arxiv": 12 * 3600,
+    "biorxiv": 12 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+# Empty results are often transient (captcha, throttling), so they expire quickly.
+NEGATIVE_TTL = 3600
+
+# Published abstracts practically never change. Pages without a parsable abstract are retried
+# after a while, failed fetches much sooner.
+ABSTRACT_TTL = 30 * 24 * 3600
+ABSTRACT_NEGATIVE_TTL = 6 * 3600
+ABSTRACT_ERROR_TTL = 600
+
+# Directory the SQLite stores and the vector index live in, unless their own *_PATH says otherwise. The
+# app directory is read-only on App Engine, where this points at /tmp.
+DATA_DIR = os.getenv("DATA_DIR", ".")
+
+# SQLite tables are counted every EVICT_EVERY writes rather than on each, and once over their size
+# trimmed to EVICT_LOW_WATER of it, so that the next pass isn't due right away.
+EVICT_EVERY = 1000
+EVICT_LOW_WATER = 0.9
+
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.replace(".", "").replace(",", "").lower().split())
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a paper URL so that trivially different links to the same page share a cache entry."""
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+    scheme = scheme.lower()
+    netloc = netloc.lower()
+    if (scheme, netloc[-3:]) == ("http", ":80") or (scheme, netloc[-4:]) == ("https", ":443"):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = path.rstrip("/") or "/"
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if not k.startswith("utm_"))
+    return urlunsplit((scheme, netloc, path, urlencode(params), ""))
+
+
+class MemoryStore:
+    """In-process LRU store. Entries are evicted least-recently-used once `maxsize` is reached."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def entry(self, key: str) -> tuple:
+        """`(value, expires)` of a live entry, or None."""
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[1] < time.time():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return item
+
+    def get(self, key: str):
+        entry = self.entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key: str, value, ttl: float):
+        self.data[key] = (value, time.time() + ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def delete(self, key: str):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SQLiteDatabase:
+    """SQLite database in WAL mode, opened on first use rather than when the module creating it is
+    imported, so that importing the app needs nothing writable. Subclasses create their tables in `setup`.
+
+    The connection is shared by the event loop and worker threads; transactions hold `lock`, so that two
+    threads never interleave statements of one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @cached_property
+    def conn(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self.setup(conn)
+        return conn
+
+    def setup(self, conn: sqlite3.Connection):
+        pass
+
+
+class SQLiteTable(SQLiteDatabase):
+    """Base of the stores kept in one SQLite table keyed on `key`, bounded to `maxsize` rows.
+
+    Rows are counted every EVICT_EVERY writes rather than on each, and once over `maxsize` the table
+    is trimmed to EVICT_LOW_WATER of it, lowest `order` first.
+    """
+
+    table = ""
+    order = ""
+
+    def __init__(self, path: str, maxsize: int):
+        super().__init__(path)
+        self.maxsize = maxsize
+        self.writes = 0
+
+    def written(self):
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        (count,) = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.maxsize:
+            self.expire()
+            self.conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY {self.order} LIMIT max(0, (SELECT COUNT(*) FROM {self.table}) - ?))",
+                (int(self.maxsize * EVICT_LOW_WATER),),
+            )
+
+    def expire(self):
+        """Drop rows known to be stale, before the trim falls back on `order`."""
+
+    def clear(self):
+        self.conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class SQLiteStore(SQLiteTable):
+    """Persistent store backed by a single SQLite table. Values are stored as JSON, dataclasses included."""
+
+    table = "results"
+    order = "accessed"
+
+    def __init__(self, path: str = "cache.db", maxsize: int = 100_000):
+        super().__init__(path, maxsize)
+
+    def setup(self, conn: sqlite3.Connection):
+        conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def entry(self, key: str) -> tuple:
+        """`(value, expires)` of a live entry, or None."""
+        row = self.conn.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        now = time.time()
+        if expires < now:
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        return orjson.loads(value), expires
+
+    def get(self, key: str):
+        entry = self.entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key: str, value, ttl: float):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, orjson.dumps(value), now + ttl, now),
+        )
+        self.written()
+
+    def expire(self):
+        self.conn.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+
+    def delete(self, key: str):
+        self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional persistent store.
+
+    Lookups hit memory first and fall back to the store; store hits are promoted into memory for the
+    time they have left, so an entry never outlives the TTL it was saved with.
+    """
+
+    def __init__(self, store=None, memory=None):
+        self.store = store
+        self.memory = memory if memory is not None else MemoryStore()
+
+    def lookup(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.store is not None and (entry := self.store.entry(key)) is not None:
+            value, expires = entry
+            self.memory.set(key, value, expires - time.time())
+        return value
+
+    def save(self, key: str, value, ttl: float):
+        self.memory.set(key, value, ttl)
+        if self.store is not None:
+            self.store.set(key, value, ttl)
+
+    def drop(self, key: str):
+        self.memory.delete(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+
+class ResultCache(TieredCache):
+    """Two tier cache for per-source scraping results, keyed on the author, affiliation and source."""
+
+    def __init__(self, store=None, memory=None, ttl: dict = None):
+        super().__init__(store, memory)
+        self.ttl = SOURCE_TTL | (ttl or {})
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(author: str, affiliation: str = None, source: str = "") -> str:
+        author = normalize_name(author)
+        variants = "|".join(sorted(generate_variants(author)))
+        affiliation = normalize_name(affiliation) if affiliation else ""
+        return hashlib.sha1(f"{author}\0{variants}\0{affiliation}\0{source}".encode()).hexdigest()
+
+    def get(self, author: str, affiliation: str = None, source: str = ""):
+        value = self.lookup(self.key(author, affiliation, source))
+        if value is None:
+            self.misses += 1
+            cache_total.labels(cache="result", result="miss").inc()
+        else:
+            self.hits += 1
+            cache_total.labels(cache="result", result="hit").inc()
+        return value
+
+    def set(self, author: str, value, affiliation: str = None, source: str = ""):
+        if value is None:
+            return
+        self.save(self.key(author, affiliation, source), value, self.ttl.get(source, DEFAULT_TTL) if value else NEGATIVE_TTL)
+
+    def invalidate(self, author: str, affiliation: str = None, source: str = ""):
+        self.drop(self.key(author, affiliation, source))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "store_entries": len(self.store) if self.store is not None else 0,
+        }
+
+
+class AbstractCache(TieredCache):
+    """Cache of parsed abstracts keyed on the canonical paper URL.
+
+    Concurrent requests for the same URL are coalesced: the first caller starts the fetch and every
+    other caller awaits the same task. Misses, including failed fetches, are cached as well.
+    """
+
+    def __init__(self, store=None, memory=None):
+        super().__init__(store, memory if memory is not None else MemoryStore(8192))
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha1(f"abstract\0{canonical_url(url)}".encode()).hexdigest()
+
+    def remember(self, key: str, value: str, ttl: float):
+        # Wrapped in a list so that a cached miss can be told apart from a cache miss.
+        self.save(key, [value], ttl)
+
+    async def resolve(self, key: str, session: aiohttp.ClientSession, url: str, source: str = None) -> str:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            with span("abstract", source=source, url=url):
+                value = await abstract(session, url, source)
+        except TimeoutError:
+            # Usually the caller's deadline rather than the page, so don't remember it.
+            status = "timeout"
+            return None
+        except Exception:
+            status = "error"
+            self.remember(key, None, ABSTRACT_ERROR_TTL)
+            return None
+        finally:
+            abstract_seconds.labels(source=source or "unknown", status=status).observe(time.perf_counter() - started)
+        self.remember(key, value, ABSTRACT_TTL if value else ABSTRACT_NEGATIVE_TTL)
+        return value
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str, source: str = None) -> str:
+        key = self.key(url)
+        if (cached := self.lookup(key)) is not None:
+            self.hits += 1
+            cache_total.labels(cache="abstract", result="hit").inc()
+            return cached[0]
+
+        if task := self.inflight.get(key):
+            self.coalesced += 1
+            cache_total.labels(cache="abstract", result="coalesced").inc()
+        else:
+            self.misses += 1
+            cache_total.labels(cache="abstract", result="miss").inc()
+            task = asyncio.create_task(self.resolve(key, session, url, source))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded so that one cancelled caller doesn't cancel the fetch for everyone waiting on it.
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self.inflight),
+            "memory_entries": len(self.memory),
+        }
+
+
+def create_store():
+    if os.getenv("CACHE_BACKEND", "sqlite") == "memory":
+        return None
+    return SQLiteStore(os.getenv("CACHE_PATH") or data_path("cache.db"), int(os.getenv("CACHE_MAX_ENTRIES", 100_000)))
+
+
+store = create_store()
+result_cache = ResultCache(store=store, memory=MemoryStore(int(os.getenv("CACHE_MEMORY_SIZE", 1024))))
+abstract_cache = AbstractCache(store=store, memory=MemoryStore(int(os.getenv("ABSTRACT_CACHE_MEMORY_SIZE", 8192))))
+fetch_abstract = abstract_cache.fetch
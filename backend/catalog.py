@@ -0,0 +1,205 @@
+import base64
+import json
+import os
+import re
+import sqlite3
+import time
+
+import orjson
+from cache import SQLiteDatabase, data_path, normalize_name
+from dotenv import load_dotenv
+from publication import Publication
+
+load_dotenv()
+
+SORTS = {
+    # sort -> (ORDER BY, keyset comparison against the cursor)
+    "year_desc": ("COALESCE(p.year, 0) DESC, p.id DESC", "(COALESCE(p.year, 0), p.id) < (?, ?)"),
+    "year_asc": ("COALESCE(p.year, 0) ASC, p.id ASC", "(COALESCE(p.year, 0), p.id) > (?, ?)"),
+    "relevance": ("bm25(publications_fts), p.id", None),
+}
+MAX_LIMIT = 500
+
+
+def fts_query(text: str) -> str:
+    """Free text -> FTS5 query matching every word as a prefix, so user input can't break the syntax."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text.lower()))
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or not all(isinstance(value, (int, float)) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class Catalog(SQLiteDatabase):
+    """Indexed store of the latest publications of every queried author, for filtering and paging
+    on the server instead of in the browser.
+
+    Title, abstract and authors are full text indexed with FTS5; year, source and author filters use
+    plain indexes. Pages are fetched with keyset cursors, so deep pages cost the same as the first.
+    """
+
+    def setup(self, conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS publications (
+                id INTEGER PRIMARY KEY, author_key TEXT, author TEXT, affiliation TEXT, source TEXT, title TEXT,
+                year INTEGER, authors TEXT, link TEXT, abstract TEXT, links TEXT, sources TEXT, updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS publications_author ON publications (author_key, year, id);
+            CREATE INDEX IF NOT EXISTS publications_year ON publications (year, id);
+            CREATE TABLE IF NOT EXISTS publication_sources (publication_id INTEGER, source TEXT, PRIMARY KEY (source, publication_id)) WITHOUT ROWID;
+            CREATE VIRTUAL TABLE IF NOT EXISTS publications_fts USING fts5(
+                title, abstract, authors, content='publications', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS publications_insert AFTER INSERT ON publications BEGIN
+                INSERT INTO publications_fts (rowid, title, abstract, authors) VALUES (new.id, new.title, new.abstract, new.authors);
+            END;
+            CREATE TRIGGER IF NOT EXISTS publications_delete AFTER DELETE ON publications BEGIN
+                INSERT INTO publications_fts (publications_fts, rowid, title, abstract, authors) VALUES ('delete', old.id, old.title, old.abstract, old.authors);
+                DELETE FROM publication_sources WHERE publication_id = old.id;
+            END;
+        """)
+
+    def replace(self, author: str, records: list[Publication], affiliation: str = None):
+        """Store the publications of an author, replacing what the previous query of that author stored."""
+        key = normalize_name(author)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM publications WHERE author_key = ?", (key,))
+            for record in records:
+                sources = record.sources or [record.source]
+                cursor = self.conn.execute(
+                    "INSERT INTO publications (author_key, author, affiliation, source, title, year, authors, link, abstract, links, sources, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key, author, affiliation, record.source, record.title, record.year, orjson.dumps(record.authors).decode(),
+                        record.link, record.abstract, orjson.dumps(record.links or [record.link]).decode(), orjson.dumps(sources).decode(), now,
+                    ),
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO publication_sources VALUES (?, ?)", [(cursor.lastrowid, source) for source in set(sources)]
+                )
+
+    def records(self, author: str) -> list[Publication]:
+        """Stored publications of an author, in the order they were stored."""
+        rows = self.conn.execute(
+            "SELECT source, title, year, authors, link, abstract, links, sources FROM publications WHERE author_key = ? ORDER BY id", (normalize_name(author),)
+        ).fetchall()
+        return [
+            Publication(source, title, year, json.loads(authors), link, abstract, json.loads(links), json.loads(sources))
+            for source, title, year, authors, link, abstract, links, sources in rows
+        ]
+
+    def authors(self, before: float = None, limit: int = None) -> list[tuple]:
+        """`(author, affiliation, latest year, updated)` of stored authors, least recently updated first,
+        only those last updated before `before` if given."""
+        return self.conn.execute(
+            "SELECT author, affiliation, MAX(year), MIN(updated) FROM publications GROUP BY author_key"
+            " HAVING MIN(updated) < ? ORDER BY MIN(updated) LIMIT ?",
+            (before if before is not None else float("inf"), limit if limit is not None else -1),
+        ).fetchall()
+
+    def touch(self, author: str):
+        """Mark the publications of an author as up to date without changing them."""
+        self.conn.execute("UPDATE publications SET updated = ? WHERE author_key = ?", (time.time(), normalize_name(author)))
+
+    def search(
+        self,
+        authors: list[str] = None,
+        year_from: int = None,
+        year_to: int = None,
+        sources: list[str] = None,
+        text: str = None,
+        sort: str = "year_desc",
+        limit: int = 50,
+        cursor: str = None,
+        count: bool = False,
+    ) -> dict:
+        """One page of stored publications matching every given filter, with the cursor of the next page."""
+        if sort not in SORTS:
+            raise ValueError(f"Sort must be one of {list(SORTS)}")
+        limit = max(1, min(limit, MAX_LIMIT))
+        match = fts_query(text) if text else None
+        if sort == "relevance" and not match:
+            sort = "year_desc"
+        order, keyset = SORTS[sort]
+
+        joins, where, params = "", [], []
+        if match:
+            joins = "JOIN publications_fts ON publications_fts.rowid = p.id"
+            where.append("publications_fts MATCH ?")
+            params.append(match)
+        if authors:
+            where.append(f"p.author_key IN ({', '.join('?' * len(authors))})")
+            params += [normalize_name(author) for author in authors]
+        if year_from is not None:
+            where.append("p.year >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            where.append("p.year <= ?")
+            params.append(year_to)
+        if sources:
+            where.append(f"p.id IN (SELECT publication_id FROM publication_sources WHERE source IN ({', '.join('?' * len(sources))}))")
+            params += sources
+
+        filters = f"FROM publications p {joins} WHERE {' AND '.join(where) or '1'}"
+        total = self.conn.execute(f"SELECT COUNT(*) {filters}", params).fetchone()[0] if count else None
+
+        offset = 0
+        if cursor:
+            position = decode_cursor(cursor)
+            if len(position) != (2 if keyset else 1):
+                raise ValueError("Cursor doesn't belong to this sort order")
+            if keyset:
+                filters += f" AND {keyset}"
+                params += position
+            else:
+                # bm25 scores can't be compared across queries, relevance pages use an offset instead.
+                offset = position[0]
+
+        rows = self.conn.execute(
+            f"SELECT p.id, p.author, p.source, p.title, p.year, p.authors, p.link, p.abstract, p.links, p.sources {filters} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit + 1, offset],
+        ).fetchall()
+
+        following = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            following = encode_cursor([last[4] or 0, last[0]] if keyset else [offset + limit])
+
+        data = [
+            {
+                "author": author,
+                "source": source,
+                "title": title,
+                "year": year,
+                "authors": json.loads(authors),
+                "link": link,
+                "abstract": abstract,
+                "links": json.loads(links),
+                "sources": json.loads(sources),
+            }
+            for _, author, source, title, year, authors, link, abstract, links, sources in rows
+        ]
+        response = {"data": data, "next": following}
+        if count:
+            response["total"] = total
+        return response
+
+    def stats(self) -> dict:
+        authors, publications = self.conn.execute("SELECT COUNT(DISTINCT author_key), COUNT(*) FROM publications").fetchone()
+        return {"authors": authors, "publications": publications}
+
+
+catalog = Catalog(os.getenv("CATALOG_PATH") or data_path("publications.db"))
@@ -0,0 +1,140 @@
+import re
+import zlib
+from dataclasses import replace
+
+import numpy as np
+from publication import Publication
+from rapidfuzz import fuzz
+
+DOI = re.compile(r"10\.\d{4,9}/[^\s?#&]+", re.IGNORECASE)
+
+# MinHash over character 3-grams of the normalized title, split into LSH bands. Two titles land in
+# the same bucket of at least one band with high probability once they are ~80% similar, so only
+# those pairs are ever compared.
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+TITLE_RATIO = 93
+
+_prime = (1 << 61) - 1
+_rng = np.random.default_rng(1614)
+_a = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_b = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_title(title: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (title or "").lower()).split())
+
+
+def extract_doi(link: str) -> str:
+    match = DOI.search(link or "")
+    return match.group(0).lower().rstrip(".") if match else None
+
+
+def minhash(title: str) -> np.ndarray:
+    shingles = {title[i : i + SHINGLE] for i in range(max(1, len(title) - SHINGLE + 1))}
+    hashes = np.fromiter((zlib.crc32(i.encode()) for i in shingles), dtype=np.uint64, count=len(shingles))
+    return ((np.outer(_a, hashes) + _b[:, None]) % _prime).min(axis=1)
+
+
+def merge(record: Publication, other: Publication):
+    """Fold `other` into `record`, keeping every link and source and the longest abstract."""
+    for link, source in zip(other.links, other.sources):
+        if link not in record.links:
+            record.links.append(link)
+            record.sources.append(source)
+    if len(other.abstract or "") > len(record.abstract or ""):
+        record.abstract = other.abstract
+    if len(other.authors or []) > len(record.authors or []):
+        record.authors = other.authors
+    if record.year is None:
+        record.year = other.year
+
+
+def compatible(year: int, other: int) -> bool:
+    """Whether two years can belong to one paper, a preprint and its publication are often a year apart."""
+    return not (year and other and abs(year - other) > 1)
+
+
+class Deduplicator:
+    """Incremental index merging duplicate publications across sources.
+
+    Records are matched on DOI, then on exact normalized title, then on near-identical titles from
+    the same LSH bucket; title matches need compatible years, and untitled records only match on DOI.
+    Duplicates are merged into the first record seen, which gains `links` and `sources` lists
+    covering every copy.
+    """
+
+    def __init__(self):
+        self.records: list[Publication] = []
+        # Normalized title of each record, computed once rather than for every candidate comparison.
+        self.normalized: list[str] = []
+        self.dois: dict[str, int] = {}
+        self.titles: dict[str, list[int]] = {}
+        self.buckets: dict[tuple, list[int]] = {}
+
+    def find(self, title: str, doi: str, year, signature: np.ndarray):
+        if doi and doi in self.dois:
+            return self.dois[doi]
+        if not title:
+            return None
+        for index in self.titles.get(title, []):
+            if compatible(year, self.records[index].year):
+                return index
+        seen = set()
+        for band in range(BANDS):
+            for index in self.buckets.get((band, signature[band * ROWS : (band + 1) * ROWS].tobytes()), []):
+                if index in seen:
+                    continue
+                seen.add(index)
+                if compatible(year, self.records[index].year) and fuzz.ratio(title, self.normalized[index]) >= TITLE_RATIO:
+                    return index
+        return None
+
+    def add(self, record: Publication):
+        """Add a record, returning `(record, True)` if it's new or `(merged record, False)` otherwise."""
+        # A copy, the source's own records may be shared through the result cache. Records merged
+        # before, e.g. read back from the catalog, keep every link they already have.
+        record = replace(record, links=list(record.links or [record.link]), sources=list(record.sources or [record.source]))
+        title = normalize_title(record.title)
+        doi = extract_doi(record.link)
+        signature = minhash(title)
+
+        index = self.find(title, doi, record.year, signature)
+        if index is not None:
+            merge(self.records[index], record)
+            if doi:
+                self.dois.setdefault(doi, index)
+            return self.records[index], False
+
+        index = len(self.records)
+        self.records.append(record)
+        self.normalized.append(title)
+        if doi:
+            self.dois[doi] = index
+        if not title:
+            return record, True
+        self.titles.setdefault(title, []).append(index)
+        for band in range(BANDS):
+            self.buckets.setdefault((band, signature[band * ROWS : (band + 1) * ROWS].tobytes()), []).append(index)
+        return record, True
+
+    def extend(self, records: list[Publication]) -> tuple[list[Publication], list[Publication]]:
+        """Add many records, returning the new ones and the existing ones they were merged into."""
+        added, merged, seen = [], [], set()
+        for record in records:
+            result, new = self.add(record)
+            if new:
+                added.append(result)
+                seen.add(id(result))
+            elif id(result) not in seen:
+                merged.append(result)
+                seen.add(id(result))
+        return added, merged
+
+
+def dedupe(records: list[Publication]) -> list[Publication]:
+    index = Deduplicator()
+    index.extend(records)
+    return index.records
@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram
+
+try:
+    from opentelemetry import trace
+
+    tracer = trace.get_tracer("scholarsearch")
+except ImportError:
+    tracer = None
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+author_seconds = Histogram("scholarsearch_author_seconds", "Time to scrape every source of one author", buckets=LATENCY_BUCKETS)
+source_seconds = Histogram("scholarsearch_source_seconds", "Time spent in each source", ["source", "status"], buckets=LATENCY_BUCKETS)
+request_seconds = Histogram("scholarsearch_request_seconds", "Outbound request latency, from sending to releasing the response", ["host"], buckets=LATENCY_BUCKETS)
+request_total = Counter("scholarsearch_requests_total", "Outbound requests by host and response status", ["host", "status"])
+queue_seconds = Histogram("scholarsearch_queue_seconds", "Time outbound requests wait for the scheduler", ["host"], buckets=LATENCY_BUCKETS)
+abstract_seconds = Histogram("scholarsearch_abstract_seconds", "Time to fetch and parse an uncached abstract", ["source", "status"], buckets=LATENCY_BUCKETS)
+parse_seconds = Histogram("scholarsearch_parse_seconds", "Time to parse a page, including the hop to the parser pool", ["parser"], buckets=PARSE_BUCKETS)
+cache_total = Counter("scholarsearch_cache_total", "Cache lookups by cache and outcome", ["cache", "result"])
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """OpenTelemetry span around a block, a no-op unless opentelemetry is installed and configured."""
+    if tracer is None:
+        yield
+        return
+    with tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None}):
+        yield
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
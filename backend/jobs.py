@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import aiohttp
+import orjson
+from cache import SQLiteDatabase, data_path
+from dotenv import load_dotenv
+from scraper import main
+
+load_dotenv()
+
+
+class JobQueue(SQLiteDatabase):
+    """Persistent queue of author scrapes, one row per author of a job.
+
+    Rows go pending -> running -> done / error. Rows left running by a process that died are put
+    back to pending by `recover`, so a restart resumes every unfinished job.
+    """
+
+    def setup(self, conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, affiliation TEXT, deadline REAL, created REAL, total INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS job_authors (
+                job_id TEXT, position INTEGER, author TEXT, status TEXT, result TEXT, updated REAL,
+                PRIMARY KEY (job_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS job_authors_status ON job_authors (status, job_id, position);
+        """)
+
+    def create(self, authors: list[str], affiliation: str = None, deadline: float = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?)", (job_id, affiliation, deadline, now, len(authors)))
+            self.conn.executemany(
+                "INSERT INTO job_authors VALUES (?, ?, ?, 'pending', NULL, ?)",
+                [(job_id, position, author, now) for position, author in enumerate(authors)],
+            )
+        return job_id
+
+    def claim(self):
+        """Mark the oldest pending author as running and return it, or None if there's nothing to do."""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("""
+                SELECT a.job_id, a.position, a.author, j.affiliation, j.deadline
+                FROM job_authors a JOIN jobs j ON j.id = a.job_id
+                WHERE a.status = 'pending' ORDER BY j.created, a.position LIMIT 1
+            """).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE job_authors SET status = 'running', updated = ? WHERE job_id = ? AND position = ?",
+                    (time.time(), row[0], row[1]),
+                )
+        return row
+
+    def finish(self, job_id: str, position: int, result=None, status: str = "done"):
+        self.conn.execute(
+            "UPDATE job_authors SET status = ?, result = ?, updated = ? WHERE job_id = ? AND position = ?",
+            (status, orjson.dumps(result).decode(), time.time(), job_id, position),
+        )
+
+    def recover(self) -> int:
+        return self.conn.execute("UPDATE job_authors SET status = 'pending' WHERE status = 'running'").rowcount
+
+    def get(self, job_id: str, results: bool = True) -> dict:
+        job = self.conn.execute("SELECT affiliation, created, total FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        affiliation, created, total = job
+
+        rows = self.conn.execute(
+            "SELECT author, status, result, updated FROM job_authors WHERE job_id = ? ORDER BY position", (job_id,)
+        ).fetchall()
+        counts = {"pending": 0, "running": 0, "done": 0, "error": 0}
+        for _, status, _, _ in rows:
+            counts[status] += 1
+
+        if counts["done"] + counts["error"] == total:
+            status = "done"
+        elif counts["pending"] == total:
+            status = "pending"
+        else:
+            status = "running"
+
+        response = {
+            "id": job_id,
+            "status": status,
+            "affiliation": affiliation,
+            "created": created,
+            "updated": max(row[3] for row in rows),
+            "total": total,
+            "progress": counts,
+        }
+        if results:
+            response["results"] = {author: json.loads(result) for author, state, result, _ in rows if state in ("done", "error")}
+        return response
+
+    def result(self, job_id: str, author: str):
+        """Result of one finished author of a job, or None."""
+        row = self.conn.execute(
+            "SELECT result FROM job_authors WHERE job_id = ? AND author = ? AND status = 'done' ORDER BY position LIMIT 1", (job_id, author)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class JobRunner:
+    """Pool of workers draining a JobQueue, each scraping one author at a time."""
+
+    def __init__(self, queue: JobQueue, session: aiohttp.ClientSession, workers: int = 4):
+        self.queue = queue
+        self.session = session
+        self.workers = workers
+        self.wakeup = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self.queue.recover()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Authors being scraped stay `running` and are picked up again by `recover` on the next start.
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def work(self):
+        while True:
+            if (item := self.queue.claim()) is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=5)
+                except TimeoutError:
+                    pass
+                continue
+
+            job_id, position, author, affiliation, deadline = item
+            try:
+                result = await main(author, affiliation, session=self.session, deadline=deadline)
+            except Exception as e:
+                self.queue.finish(job_id, position, {"error": str(e)}, "error")
+            else:
+                self.queue.finish(job_id, position, result)
+
+
+job_queue = JobQueue(os.getenv("JOBS_PATH") or data_path("jobs.db"))
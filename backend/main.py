@@ -1,19 +1,36 @@
+import asyncio
 import json
 import os
 import time
 from collections import defaultdict
-from urllib.parse import unquote
+from contextlib import asynccontextmanager
 
+import orjson
 from dotenv import load_dotenv
 from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from groq import AsyncGroq
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel
 
 # from google.cloud import firestore
 # import uvicorn
-from scraper import multimain, validate_query
+import parsers
+from analytics import analytics
+from cache import abstract_cache, result_cache
+from catalog import SORTS, catalog
+from compression import CompressionMiddleware
+from jobs import JobRunner, job_queue
+from publication import Publication, to_columns
+from refresh import Refresher
+from revalidation import validators
+from scheduler import create_session, scheduler
+from scraper import multimain, stream_multimain
+from semantic import semantic_index
+from serpapi import serpapi
+from summary import summarizer
+from utils import validate_query
 
 load_dotenv()
 
@@ -21,9 +38,30 @@ if not (API_KEY := os.getenv("API_KEY")):
     raise ValueError("API_KEY environment variable not set in build.")
 
 # db = firestore.Client.from_service_account_json("credentials.json", database="ss1614").collection("authors")
-client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
 
-app = FastAPI()
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, several times faster than the standard library on large results."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.session = create_session()
+    app.state.jobs = JobRunner(job_queue, app.state.session, int(os.getenv("JOB_WORKERS", 4)))
+    app.state.jobs.start()
+    app.state.refresher = Refresher(app.state.session)
+    app.state.refresher.start()
+    yield
+    await app.state.refresher.stop()
+    await app.state.jobs.stop()
+    await app.state.session.close()
+    parsers.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,6 +69,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024)))
 
 # def background(response):
 #     for author in response:
@@ -52,47 +91,41 @@ app.add_middleware(
 #     db.add(record)
 
 
-async def generate_summary(publications) -> str:
-    prompt = (
-        f"Here is a list of publications by an author:\n\n"
-        f"{publications}\n\n"
-        f"Please generate a summary of the author's research work based on these publications. Follow this template:\n"
-        f"1. **Introduction:** Briefly introduce the author's research area.\n"
-        f"2. **Key Contributions:** Highlight the major contributions or findings from the publications.\n"
-        f"3. **Research Focus:** Describe the specific area or field of research the author is known for.\n"
-        f"4. **Overall Impact:** Summarize the significance or impact of the author's work.\n"
-        f"Provide the summary in a structured format following the above points."
-    )
-
-    chat_completion = await client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-        model="llama3-8b-8192",
-    )
-    print(chat_completion.choices[0].message.content)
-    return chat_completion.choices[0].message.content
-
-
 @app.get("/")
 def root(request: Request):
     return {
         "message": "Welcome to ScholarSearch API!",
-        "endpoints": {"status", "query"},
+        "endpoints": {"status", "metrics", "query", "query/stream", "jobs", "publications", "search", "metrics/author", "graph", "summary"},
         "ip address": [request.client.host, request.headers.get("X-Forwarded-For", request.client.host)],
     }
 
 
 @app.get("/status")
-async def status():
-    return {"status": "200 OK"}
+async def status(request: Request):
+    return {
+        "status": "200 OK",
+        "cache": result_cache.stats(),
+        "abstract_cache": abstract_cache.stats(),
+        "validators": validators.stats(),
+        "scheduler": scheduler.stats(),
+        "serpapi": serpapi.stats(),
+        "summary": summarizer.stats(),
+        "catalog": catalog.stats(),
+        "semantic": semantic_index.stats(),
+        "analytics": analytics.stats(),
+        "refresh": request.app.state.refresher.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 last_request = defaultdict(int)
 RATE_LIMIT_SECONDS = 10
+# Longest deadline, in seconds, a client may ask /query to wait for.
+MAX_DEADLINE = 300
 
 
 def wait_till_request(ip: str):
@@ -107,16 +140,31 @@ def wait_till_request(ip: str):
     return 0
 
 
-@app.get("/query")
-async def query(request: Request, background_tasks: BackgroundTasks, author: list[str] = Query(...), api_key: str = Query(...)):
+def authorize(request: Request, api_key: str, rate_limit: bool = True):
     if api_key != API_KEY:
         raise HTTPException(status_code=403, detail="Invalid API key")
 
+    if not rate_limit:
+        return
+
     wait_time = wait_till_request(request.headers.get("X-Forwarded-For", request.client.host))
 
     if wait_time > 0:
         raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Try again in {int(wait_time)} seconds.")
 
+
+@app.get("/query")
+async def query(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    author: list[str] = Query(...),
+    api_key: str = Query(...),
+    deadline: float = Query(None, gt=0, le=MAX_DEADLINE),
+    format: str = Query("records", pattern="^(records|columnar)$"),
+):
+    """Scrape every author. `format=columnar` returns each author's `data` as one list per field."""
+    authorize(request, api_key)
+
     # fetched_results = []
     # for idx in range(len(author)):
     #     author[idx] = " ".join(author[idx].split())
@@ -130,10 +178,121 @@ async def query(request: Request, background_tasks: BackgroundTasks, author: lis
     for i in author:
         if not validate_query(i):
             raise HTTPException(status_code=400, detail=f"Invalid or ambiguous author name: {i}")
-    results = await multimain(author)
+    results = await multimain(author, session=request.app.state.session, deadline=deadline)
 
     # background_tasks.add_task(background, response=results)
-    return results
+    if format == "columnar":
+        results = {name: result | {"data": to_columns(result["data"])} for name, result in results.items()}
+    # Returned directly, so FastAPI doesn't walk every publication through jsonable_encoder first.
+    return ORJSONResponse(results)
+
+
+@app.get("/query/stream")
+async def query_stream(request: Request, author: list[str] = Query(...), api_key: str = Query(...), deadline: float = Query(None, gt=0, le=MAX_DEADLINE)):
+    """Same as /query, but streams NDJSON frames per author and source as they complete."""
+    authorize(request, api_key)
+
+    for i in author:
+        if not validate_query(i):
+            raise HTTPException(status_code=400, detail=f"Invalid or ambiguous author name: {i}")
+
+    async def frames():
+        async for frame in stream_multimain(author, session=request.app.state.session, deadline=deadline):
+            yield orjson.dumps(frame) + b"\n"
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+class JobRequest(BaseModel):
+    authors: list[str]
+    affiliation: str | None = None
+    deadline: float | None = None
+
+
+@app.post("/jobs")
+async def create_job(request: Request, job: JobRequest, api_key: str = Query(...)):
+    """Queue a batch of authors to be scraped in the background."""
+    authorize(request, api_key)
+
+    if not job.authors:
+        raise HTTPException(status_code=400, detail="Atleast one author is required.")
+    if invalid := [i for i in job.authors if not validate_query(i)]:
+        raise HTTPException(status_code=400, detail=f"Invalid or ambiguous author names: {invalid}")
+    if job.deadline is not None and not 0 < job.deadline <= MAX_DEADLINE:
+        raise HTTPException(status_code=400, detail=f"Deadline must be between 0 and {MAX_DEADLINE} seconds.")
+
+    job_id = job_queue.create(job.authors, job.affiliation, job.deadline)
+    request.app.state.jobs.notify()
+    return {"id": job_id, "total": len(job.authors)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str, api_key: str = Query(...), results: bool = True, format: str = Query("records", pattern="^(records|columnar)$")):
+    """Progress of a job, with the results of every author finished so far."""
+    authorize(request, api_key, rate_limit=False)
+
+    if (job := job_queue.get(job_id, results)) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if format == "columnar" and results:
+        job["results"] = {name: result | {"data": to_columns(result["data"])} if "data" in result else result for name, result in job["results"].items()}
+    return ORJSONResponse(job)
+
+
+@app.get("/publications")
+async def publications(
+    request: Request,
+    api_key: str = Query(...),
+    author: list[str] = Query(None),
+    year_from: int = None,
+    year_to: int = None,
+    source: list[str] = Query(None),
+    q: str = None,
+    sort: str = Query("year_desc", pattern=f"^({'|'.join(SORTS)})$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None,
+    count: bool = False,
+):
+    """Filter, search, sort and page through the stored publications of every queried author.
+
+    Pass the `next` cursor of a page back as `cursor` to get the following page.
+    """
+    authorize(request, api_key, rate_limit=False)
+    try:
+        page = catalog.search(author, year_from, year_to, source, q, sort, limit, cursor, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse(page)
+
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    api_key: str = Query(...),
+    k: int = Query(10, ge=1, le=100),
+    author: list[str] = Query(None),
+    year_from: int = None,
+    year_to: int = None,
+    source: list[str] = Query(None),
+):
+    """The `k` stored publications closest in meaning to `q`, from the local vector index, without scraping."""
+    authorize(request, api_key, rate_limit=False)
+    # Off the event loop, scoring the index can take a while and waits on authors being indexed.
+    return ORJSONResponse({"data": await asyncio.to_thread(semantic_index.search, q, k, author, year_from, year_to, source)})
+
+
+@app.get("/metrics/author")
+async def author_metrics(request: Request, author: list[str] = Query(...), api_key: str = Query(...)):
+    """Publication counts by year and source, citation metrics, co-authors and collaborators of queried authors."""
+    authorize(request, api_key, rate_limit=False)
+    return ORJSONResponse({name: analytics.author(name) for name in author})
+
+
+@app.get("/graph")
+async def graph(request: Request, api_key: str = Query(...), affiliation: str = None, min_weight: int = Query(1, ge=1)):
+    """Collaboration graph between queried authors, as nodes and weighted edges."""
+    authorize(request, api_key, rate_limit=False)
+    return ORJSONResponse(analytics.graph(affiliation, min_weight))
 
 
 @app.get("/dummy")
@@ -143,27 +302,46 @@ async def dummy(request: Request, background_tasks: BackgroundTasks, author: lis
         return data
 
 
-@app.get("/summary")
-async def summary(request: Request, background_tasks: BackgroundTasks, response=Query(...), api_key: str = Query(...)):
-    if api_key != API_KEY:
-        raise HTTPException(status_code=403, detail="Invalid API key")
-
-    wait_time = wait_till_request(request.headers.get("X-Forwarded-For", request.client.host))
+@app.post("/summary")
+async def summary(request: Request, api_key: str = Query(...)):
+    """Summarize the research of an author.
 
-    if wait_time > 0:
-        raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Try again in {int(wait_time)} seconds.")
-    print(response)
+    The JSON body either carries the publications, `{"publications": [{"title", "abstract"}, ...]}`,
+    or points at a result the server already has: `{"author", "affiliation"}` for the latest query of
+    that author, or `{"job_id", "author"}` for an author of a job.
+    """
+    # Not rate limited, clients call this right after /query. LLM calls are bounded by the summarizer.
+    authorize(request, api_key, rate_limit=False)
     try:
-        response = json.loads(unquote(response))
-    except json.JSONDecodeError:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON format")
-    response = dict(response).values()[0]
-    response = [{"title": i["title"], "abstract": i["abstract"].strip()} for i in response if i["abstract"]]
-    publications = "\n".join([f"Title: {i['title']}\nAbstract: {i['abstract']}\n" for i in response])
-    result = await generate_summary(publications)
-
-    # background_tasks.add_task(background, response=results)
-    return result
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+
+    if "publications" in body:
+        publications = body["publications"]
+        if not isinstance(publications, list):
+            raise HTTPException(status_code=400, detail="Publications must be a list")
+        if not all(isinstance(i, dict) and isinstance(i.get("title") or "", str) and isinstance(i.get("abstract") or "", str) for i in publications):
+            raise HTTPException(status_code=400, detail="Publications must be objects with a string title and abstract")
+        # Only what a summary reads, whatever else the client sends along.
+        publications = [Publication.load({"title": i["title"], "abstract": i.get("abstract")}) for i in publications if i.get("title")]
+    elif not (author := body.get("author")):
+        raise HTTPException(status_code=400, detail="Either publications or an author is required.")
+    elif job_id := body.get("job_id"):
+        if (result := job_queue.result(job_id, author)) is None:
+            raise HTTPException(status_code=404, detail="No finished result for this author in the job")
+        publications = [Publication.load(i) for i in result.get("data", []) if i.get("title")]
+    elif (result := result_cache.get(author, body.get("affiliation"), "query")) is not None:
+        publications = [Publication.load(i) for i in result["data"] if isinstance(i, Publication) or i.get("title")]
+    # The cached result expires, the catalog keeps the latest publications of every queried author.
+    elif not (publications := catalog.records(author)):
+        raise HTTPException(status_code=404, detail="No stored result for this author, query it first.")
+
+    if not publications:
+        raise HTTPException(status_code=400, detail="No publications to summarize")
+    return await summarizer.summarize(publications)
 
 
 # + fetched_results
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import lxml.etree
+import lxml.html
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from dotenv import load_dotenv
+from instrumentation import parse_seconds, timed
+
+load_dotenv()
+
+# "process" keeps CPU-bound parsing off the event loop and spreads it over all cores, "thread" only
+# helps when the parser releases the GIL, "inline" parses on the event loop like before.
+PARSER_EXECUTOR = os.getenv("PARSER_EXECUTOR", "process")
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", 0)) or os.cpu_count()
+# Pages smaller than this are parsed inline, shipping them to a worker costs more than parsing them.
+INLINE_PARSE_BYTES = int(os.getenv("INLINE_PARSE_BYTES", 4096))
+# Set to 0 to always parse with BeautifulSoup instead of the lxml XPath specs below.
+FAST_PARSE = os.getenv("FAST_PARSE", "1") != "0"
+
+
+def has_class(name: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+# Where the abstract lives on each source's landing page.
+#   xpath: first match is the abstract, either an element (its text is used) or an attribute value
+#   drop:  XPaths, relative to the match, of elements removed before taking the text
+#   split: regex, the abstract is whatever follows its first match
+#   html:  the matched value is itself HTML and is reduced to its text
+ABSTRACT_SPECS = {
+    "scholar": {"xpath": f"//div[{has_class('gsh_small')}]"},
+    "pubmed": {"xpath": '//div[@id="abstract"]'},
+    "arxiv": {"xpath": f"//blockquote[{has_class('abstract')} and {has_class('mathjax')}]"},
+    "acmdl": {"xpath": '//section[@id="abstract"]'},
+    "biorxiv": {"xpath": f"//div[{has_class('highwire-markup')}]"},
+    "nature": {"xpath": f'//div[@id="Abs1-content" and {has_class("c-article-section__content")}]'},
+    "openreview": {"xpath": '//meta[@name="citation_abstract"]/@content'},
+    "jmlr": {"xpath": f"//p[{has_class('abstract')}]"},
+    "neurips": {"xpath": f"//div[{has_class('col')}]", "split": r"Abstract|abstract"},
+    "mdpi": {"xpath": f"//section[{has_class('html-abstract')}]"},
+    "ieee": {"xpath": '//meta[@property="og:description"]/@content', "html": True},
+    "frontiers": {
+        "xpath": f"(//div[{has_class('JournalFullText')}])[1]//div[{has_class('JournalAbstract')}]",
+        "drop": [f".//div[{has_class('authors')}]", f".//ul[{has_class('notes')}]"],
+    },
+}
+
+# Fields of biorxiv and nature paper pages. `authors` collects every match, the others take the first.
+PAPER_SPECS = {
+    "biorxiv": {
+        "authors": f"//span[{has_class('highwire-citation-author')}]",
+        "title": f"//h1[{has_class('highwire-cite-title')}]",
+        "year": f"//div[{has_class('panel-pane')} and {has_class('pane-custom')} and {has_class('pane-1')}]",
+        "abstract": ABSTRACT_SPECS["biorxiv"]["xpath"],
+    },
+    "nature": {
+        "authors": f"//li[{has_class('c-article-author-list__item')}]",
+        "title": f"//h1[{has_class('c-article-title')}]",
+        "year": "//time",
+        "abstract": ABSTRACT_SPECS["nature"]["xpath"],
+    },
+}
+
+_executor: Executor = None
+
+
+def executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PARSER_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(PARSER_WORKERS)
+        else:
+            _executor = ProcessPoolExecutor(PARSER_WORKERS)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def parse(function, *args):
+    """Run a parser from this module off the event loop.
+
+    Parsers take raw response bytes and return plain strings, lists and dicts, so both the input
+    and the result can be pickled to and from worker processes.
+    """
+    size = sum(len(arg) for arg in args if isinstance(arg, (bytes, str)))
+    with timed(parse_seconds, parser=function.__name__):
+        if PARSER_EXECUTOR == "inline" or size < INLINE_PARSE_BYTES:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor(), function, *args)
+
+
+def text(node) -> str:
+    if isinstance(node, Tag):
+        return node.text
+    if isinstance(node, lxml.html.HtmlElement):
+        return node.text_content()
+    if isinstance(node, str):
+        # Attribute values come back as lxml string subclasses which don't pickle.
+        return str(node)
+    return node
+
+
+def first(tree, xpath: str):
+    nodes = tree.xpath(xpath)
+    return nodes[0] if nodes else None
+
+
+def parse_abstract(source: str, raw: bytes) -> str:
+    """Extract the raw abstract text from a paper landing page of the given source.
+
+    Uses the lxml XPath spec of the source, falling back to BeautifulSoup when the spec finds nothing.
+    """
+    if source == "inspire":
+        return json.loads(raw)["metadata"]["abstracts"][0]["value"]
+
+    if FAST_PARSE and (spec := ABSTRACT_SPECS.get(source)):
+        try:
+            if abstract := xpath_abstract(spec, raw):
+                return abstract
+        except Exception:
+            pass
+    return soup_abstract(source, raw)
+
+
+def xpath_abstract(spec: dict, raw: bytes) -> str:
+    node = first(lxml.html.fromstring(raw), spec["xpath"])
+    if node is None:
+        return None
+    for xpath in spec.get("drop", []):
+        for child in node.xpath(xpath):
+            child.drop_tree()
+    abstract = text(node)
+    if spec.get("html"):
+        abstract = lxml.html.fromstring(abstract).text_content()
+    if pattern := spec.get("split"):
+        match = re.split(pattern, abstract, maxsplit=1)
+        abstract = match[1] if len(match) == 2 else None
+    return abstract
+
+
+def soup_abstract(source: str, raw: bytes) -> str:
+    abstract = None
+
+    if source == "scholar":
+        soup = BeautifulSoup(raw, "html.parser")
+        abstract = soup.find("div", {"class": "gsh_small"})
+
+    elif source == "pubmed":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("div", id="abstract")
+
+    elif source == "arxiv":
+        soup = BeautifulSoup(raw, features="xml")
+        abstract = soup.find("blockquote", {"class": "abstract mathjax"})
+
+    elif source == "acmdl":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("section", id="abstract")
+
+    elif source == "biorxiv":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("div", {"class": "highwire-markup"})
+
+    elif source == "nature":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("div", {"id": "Abs1-content", "class": "c-article-section__content"})
+
+    elif source == "openreview":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("meta", {"name": "citation_abstract"}).get("content")
+
+    elif source == "jmlr":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("p", {"class": "abstract"})
+
+    elif source == "neurips":
+        soup = BeautifulSoup(raw, "lxml")
+        content = soup.find("div", {"class": "col"}).text
+        match = re.split(r"Abstract|abstract", content, maxsplit=1)
+        abstract = match[1] if len(match) == 2 else None
+
+    elif source == "mdpi":
+        soup = BeautifulSoup(raw, "lxml")
+        abstract = soup.find("section", {"class": "html-abstract"})
+
+    elif source == "ieee":
+        soup = BeautifulSoup(raw, "lxml")
+        content = soup.select_one('meta[property="og:description"]')
+        if content and content.get("content"):
+            soup = BeautifulSoup(content["content"], "lxml")
+            abstract = soup.get_text(separator=" ", strip=True)
+
+    elif source == "frontiers":
+        soup = BeautifulSoup(raw, "lxml")
+        soup = soup.find("div", {"class": "JournalFullText"})
+        abstract = soup.find("div", {"class": "JournalAbstract"})
+
+        if authors := abstract.find("div", {"class": "authors"}):
+            authors.decompose()
+        if notes := abstract.find("ul", {"class": "notes"}):
+            notes.decompose()
+
+    return text(abstract)
+
+
+class DblpParser:
+    """Incremental parser for DBLP person XML files.
+
+    Feed it the file in chunks as it downloads; every call returns the (title, year, authors, link)
+    records completed so far. Processed elements are cleared, so memory stays flat however long the
+    file is.
+    """
+
+    tags = {"article", "inproceedings"}
+
+    def __init__(self):
+        self.parser = lxml.etree.XMLPullParser(events=("end",), resolve_entities=False, recover=True)
+
+    def feed(self, chunk: bytes) -> list[tuple]:
+        self.parser.feed(chunk)
+        return self.records()
+
+    def close(self) -> list[tuple]:
+        self.parser.close()
+        return self.records()
+
+    def records(self) -> list[tuple]:
+        results = []
+        for _, elem in self.parser.read_events():
+            if elem.tag in self.tags:
+                title = elem.find("title")
+                year = elem.findtext("year")
+                authors = [author.text for author in elem.iterfind("author")]
+                link = elem.findtext("ee")
+                if title is not None:
+                    results.append(("".join(title.itertext()).strip(), year, authors, link))
+            elif elem.tag == "r":
+                # Each publication is wrapped in an <r>, drop it and everything before it.
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        return results
+
+
+def parse_dblp(raw: bytes) -> list[tuple]:
+    """Parse a whole DBLP person XML file into (title, year, authors, link) tuples."""
+    parser = DblpParser()
+    return parser.feed(raw) + parser.close()
+
+
+def parse_pubmed(raw: bytes) -> list[tuple]:
+    """Parse a PubMed search page into (authors, title, year, pmid) tuples."""
+    soup = BeautifulSoup(raw, "lxml")
+    results = []
+    for i in soup.find_all("article", {"class": "full-docsum"}):
+        authors = i.find("span", {"class": "docsum-authors full-authors"}).text.split(",")
+        title = i.find("a", {"class": "docsum-title"}).text.strip()
+        year = i.find("span", {"class": "docsum-journal-citation short-journal-citation"}).text.strip()
+        pmid = i.find("span", {"class": "citation-part"}).text.split()[-1]
+        results.append((authors, title, year, pmid))
+    return results
+
+
+def parse_acmdl(raw: bytes) -> list[tuple]:
+    """Parse an ACM DL search page into (authors, title, year, href, abstract) tuples."""
+    soup = BeautifulSoup(raw, "lxml")
+    results = []
+    for i in soup.find_all("li", {"class": "search__item issue-item-container"}):
+        authors = [j.text for j in i.find_all("span", {"class": "hlFld-ContribAuthor"})]
+        title = i.find("span", {"class": "hlFld-Title"})
+        year = i.find("div", {"class": "bookPubDate simple-tooltip__block--b"}).text
+        abstract = i.find("div", {"class": "issue-item__abstract truncate-text"}).text.strip()
+        results.append((authors, title.text.strip(), year, title.find("a").get("href"), abstract))
+    return results
+
+
+def parse_links(raw: bytes, classname: str) -> list[str]:
+    """Collect the hrefs of all result links with the given class from a search page."""
+    soup = BeautifulSoup(raw, "lxml")
+    return [i.get("href", None) for i in soup.find_all("a", {"class": classname})]
+
+
+def parse_paper(source: str, raw: bytes) -> dict:
+    """Parse a biorxiv or nature paper page into its authors, title, raw year text and abstract."""
+    if FAST_PARSE and (spec := PAPER_SPECS.get(source)):
+        try:
+            tree = lxml.html.fromstring(raw)
+            return {
+                "authors": [text(i) for i in tree.xpath(spec["authors"])],
+                "title": text(first(tree, spec["title"])).strip(),
+                "year": text(first(tree, spec["year"])),
+                "abstract": text(first(tree, spec["abstract"])),
+            }
+        except Exception:
+            pass
+    return soup_paper(source, raw)
+
+
+def soup_paper(source: str, raw: bytes) -> dict:
+    soup = BeautifulSoup(raw, "lxml")
+    if source == "biorxiv":
+        return {
+            "authors": [i.text for i in soup.find_all("span", {"class": "highwire-citation-author"})],
+            "title": soup.find("h1", {"class": "highwire-cite-title"}).text.strip(),
+            "year": soup.find("div", {"class": "panel-pane pane-custom pane-1"}).text,
+            "abstract": text(soup.find("div", {"class": "highwire-markup"})),
+        }
+    if source == "nature":
+        return {
+            "authors": [i.text for i in soup.find_all("li", {"class": "c-article-author-list__item"})],
+            "title": soup.find("h1", {"class": "c-article-title"}).text.strip(),
+            "year": soup.find("time").text,
+            "abstract": text(soup.find("div", {"id": "Abs1-content", "class": "c-article-section__content"})),
+        }
+    return None
@@ -0,0 +1,47 @@
+import sys
+from dataclasses import dataclass, fields
+
+
+@dataclass(slots=True)
+class Publication:
+    """One paper as found on one source, or merged across sources once `links`/`sources` are set.
+
+    Slotted to keep institution-wide runs with hundreds of thousands of records small. Source names
+    and author strings are interned, so a co-author appearing on many papers is stored once.
+    orjson serializes it natively, so it goes out in responses without being copied into a dict.
+    """
+
+    source: str
+    title: str
+    year: int | None
+    authors: list[str]
+    link: str
+    abstract: str | None
+    links: list[str] | None = None
+    sources: list[str] | None = None
+
+    def __post_init__(self):
+        self.source = sys.intern(self.source or "")
+        self.authors = [sys.intern(author) for author in self.authors or []]
+
+    @classmethod
+    def load(cls, data):
+        """Publication from its serialized dict, e.g. read back from the persistent cache. Publications pass through.
+
+        Missing fields are left empty, so that `{"title", "abstract"}` alone, as clients send to /summary, loads.
+        """
+        if isinstance(data, cls):
+            return data
+        return cls(**{name: data.get(name) for name in FIELDS})
+
+
+FIELDS = [field.name for field in fields(Publication)]
+
+
+def to_columns(records: list) -> dict:
+    """Column-oriented form of publications or publication dicts, one list per field instead of one record each."""
+    if all(isinstance(record, Publication) for record in records):
+        return {name: [getattr(record, name) for record in records] for name in FIELDS}
+    records = [record if isinstance(record, dict) else {name: getattr(record, name) for name in FIELDS} for record in records]
+    names = list(dict.fromkeys(key for record in records for key in record))
+    return {name: [record.get(name) for record in records] for name in names}
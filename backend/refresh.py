@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+from cache import result_cache
+from catalog import catalog
+from dedup import Deduplicator
+from dotenv import load_dotenv
+from scheduler import current_owner, request_deadline
+from scraper import DEFAULT_FUNCTIONS, DEFAULT_SOURCE_TIMEOUT, SOURCE_TIMEOUTS, arxiv, inspire, publications, pubmed, run_resolution, save, truncated
+from summary import summarizer
+
+load_dotenv()
+
+# Seconds between refreshes of each stored author, 0 turns scheduled refreshes off.
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", 24 * 3600))
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", 2))
+# Seconds between looks for authors due a refresh.
+REFRESH_POLL = 300
+# Authors refreshed per look, so that a backlog is spread over several polls.
+REFRESH_BATCH = 100
+REFRESH_SUMMARIES = os.getenv("REFRESH_SUMMARIES", "1") == "1"
+# Sources that can list an author's publications newest first, so only new ones are fetched. Each is
+# only asked about authors it was scraped for: by default, or when it found some of their publications.
+RECENT_SOURCES = [arxiv, pubmed, inspire]
+
+
+class Refresher:
+    """Keeps stored authors up to date without scraping them again from scratch.
+
+    Every `interval` seconds an author is due: the sources that sort by date and that the author was
+    scraped with are asked only for publications since the latest year already stored, and whatever is
+    new is deduplicated into the stored publications. Authors without new publications are only marked
+    as checked; the others are saved like a fresh query and get their summary regenerated.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, interval: float = REFRESH_INTERVAL, concurrency: int = REFRESH_CONCURRENCY):
+        self.session = session
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.task: asyncio.Task = None
+        self.refreshed = 0
+        self.changed = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_run = None
+
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def run(self):
+        while True:
+            if due := catalog.authors(time.time() - self.interval, REFRESH_BATCH):
+                self.last_run = time.time()
+                await asyncio.gather(*[self.guarded(author, affiliation, year) for author, affiliation, year, _ in due])
+            else:
+                await asyncio.sleep(REFRESH_POLL)
+
+    async def guarded(self, author: str, affiliation: str, since: int):
+        async with self.semaphore:
+            try:
+                await self.refresh(author, affiliation, since)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{author}: {e!r}"
+                # Checked all the same, so that a failing author isn't retried on every poll.
+                catalog.touch(author)
+
+    async def fetch(self, author: str, since: int, functions: list) -> dict:
+        """`{source: (publications, status)}` of the publications of an author since a year."""
+        current_owner.set(author)
+        loop = asyncio.get_running_loop()
+
+        async def run(function):
+            end = loop.time() + SOURCE_TIMEOUTS.get(function.__name__, DEFAULT_SOURCE_TIMEOUT)
+            request_deadline.set(end)
+            truncated.set(False)
+            try:
+                async with asyncio.timeout_at(end):
+                    records = publications(await function(self.session, author, since=since))
+                return records, "partial" if truncated.get() else "ok"
+            except TimeoutError:
+                return [], "timeout"
+            except Exception:
+                return [], "error"
+
+        results = await asyncio.gather(*[run(function) for function in functions])
+        return dict(zip([function.__name__ for function in functions], results))
+
+    async def refresh(self, author: str, affiliation: str = None, since: int = None) -> bool:
+        """Fetch and merge the new publications of a stored author. True if any were found."""
+        index = Deduplicator()
+        index.extend(catalog.records(author))
+        found = {source for record in index.records for source in record.sources or [record.source]}
+        functions = [function for function in RECENT_SOURCES if function in DEFAULT_FUNCTIONS or function.__name__ in found]
+        results = await self.fetch(author, since, functions)
+        added = []
+        for records, _ in results.values():
+            # Publications found again merge into their stored copy, which can fill in a link or a longer
+            # abstract but isn't worth saving and summarizing the author again for.
+            added += index.extend(records)[0]
+        self.refreshed += 1
+
+        if not added:
+            catalog.touch(author)
+            return False
+
+        _, abstracts = await run_resolution(self.session, added)
+        previous = result_cache.get(author, affiliation, "query")
+        status = {name: state for name, (_, state) in results.items()} | {"abstracts": abstracts, "refresh": f"{len(added)} new"}
+        await save(author, {"data": index.records, "info": previous["info"] if previous else None, "status": status}, affiliation)
+        self.changed += 1
+        if REFRESH_SUMMARIES:
+            # Summaries are keyed on the publications, the new set misses the cache and gets generated.
+            await summarizer.summarize(index.records)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "refreshed": self.refreshed,
+            "changed": self.changed,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run": self.last_run,
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+
+import aiohttp
+import orjson
+from cache import SQLiteTable, data_path
+from dotenv import load_dotenv
+from instrumentation import cache_total
+from scheduler import fetch
+
+load_dotenv()
+
+# Validators of pages not requested for this long are dropped first once the store is full.
+VALIDATORS_MAX_ENTRIES = int(os.getenv("VALIDATORS_MAX_ENTRIES", 200_000))
+
+
+class ValidatorStore(SQLiteTable):
+    """ETag and Last-Modified validators of fetched URLs, stored with what was parsed out of the response.
+
+    Entries are keyed on the URL and the kind of result parsed from it, since the same page can be
+    read by several callers (a paper page by its source's worker and for its abstract) which each
+    need their own result back on a 304.
+
+    Kept apart from the result cache: entries never expire, since the server decides with a 304
+    whether they are still good, and they have to outlive every cached result of the author.
+    """
+
+    table = "validators"
+    order = "checked"
+
+    def __init__(self, path: str = "validators.db", maxsize: int = VALIDATORS_MAX_ENTRIES):
+        super().__init__(path, maxsize)
+        self.not_modified = 0
+        self.modified = 0
+        self.unconditional = 0
+
+    def setup(self, conn: sqlite3.Connection):
+        conn.execute("CREATE TABLE IF NOT EXISTS validators (key TEXT PRIMARY KEY, etag TEXT, modified TEXT, result TEXT, checked REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS validators_checked ON validators (checked)")
+
+    @staticmethod
+    def key(url: str, kind: str) -> str:
+        return hashlib.sha1(f"{kind}\0{url}".encode()).hexdigest()
+
+    def get(self, url: str, kind: str) -> tuple:
+        """`(etag, last_modified, result)` of the last response from `url` parsed as `kind`, or None."""
+        row = self.conn.execute("SELECT etag, modified, result FROM validators WHERE key = ?", (self.key(url, kind),)).fetchone()
+        if row is None:
+            return None
+        etag, modified, result = row
+        return etag, modified, orjson.loads(result)
+
+    def set(self, url: str, kind: str, etag: str, modified: str, result):
+        self.conn.execute("INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?)", (self.key(url, kind), etag, modified, orjson.dumps(result), time.time()))
+        self.written()
+
+    def touch(self, url: str, kind: str):
+        self.conn.execute("UPDATE validators SET checked = ? WHERE key = ?", (time.time(), self.key(url, kind)))
+
+    def stats(self) -> dict:
+        return {"not_modified": self.not_modified, "modified": self.modified, "unconditional": self.unconditional, "entries": len(self)}
+
+
+async def outcome(value):
+    return await value if inspect.isawaitable(value) else value
+
+
+async def revalidate(session: aiohttp.ClientSession, url: str, kind: str, read=None, parse=None, **kwargs):
+    """GET `url` through `fetch`, conditionally when an earlier response left validators, and return
+    what `parse(read(response))` gives. Error statuses raise `aiohttp.ClientResponseError`, other
+    statuses but 200 and 304 return None.
+
+    `read` takes what's needed off the open response, its body by default; `parse` turns that into
+    the result, once the connection is released. Results of responses carrying an ETag or
+    Last-Modified are kept with them, and a 304 returns the kept result without reading or parsing.
+    Both may be sync or async; results must survive a round trip through JSON. `kind` names what
+    `parse` makes of the page, callers parsing the same URL differently must pass different kinds.
+    """
+    stored = validators.get(url, kind)
+    headers = dict(kwargs.pop("headers", None) or {})
+    if stored:
+        etag, modified, _ = stored
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+
+    async with fetch(session, url, headers=headers, **kwargs) as response:
+        if response.status == 304 and stored:
+            validators.not_modified += 1
+            cache_total.labels(cache="http", result="not_modified").inc()
+            validators.touch(url, kind)
+            return stored[2]
+        # Throttling and captcha pages must fail the source, not pass for a page without results.
+        response.raise_for_status()
+        if response.status != 200:
+            return None
+        etag, modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        data = await outcome(read(response) if read else response.read())
+
+    result = await outcome(parse(data)) if parse else data
+    if etag or modified:
+        validators.modified += 1
+        cache_total.labels(cache="http", result="modified" if stored else "new").inc()
+        validators.set(url, kind, etag, modified, result)
+    else:
+        validators.unconditional += 1
+        cache_total.labels(cache="http", result="unconditional").inc()
+    return result
+
+
+validators = ValidatorStore(os.getenv("VALIDATORS_PATH") or data_path("validators.db"))
@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+from dotenv import load_dotenv
+from instrumentation import queue_seconds, request_seconds, request_total, span
+
+load_dotenv()
+
+# Requests per second allowed for each host. Hosts are the ones in utils.source_map plus the listing
+# APIs used by scraper.py; anything else falls back to DEFAULT_RATE.
+HOST_RATES = {
+    "serpapi.com": 5,
+    "dblp.org": 2,
+    "export.arxiv.org": 1,
+    "arxiv.org": 2,
+    "pubmed.ncbi.nlm.nih.gov": 3,
+    "inspirehep.net": 3,
+    "dl.acm.org": 2,
+    "www.biorxiv.org": 4,
+    "www.nature.com": 4,
+    "ieeexplore.ieee.org": 2,
+    "proceedings.neurips.cc": 4,
+    "openreview.net": 2,
+    "jmlr.org": 4,
+    "www.mdpi.com": 4,
+    "www.frontiersin.org": 4,
+    "doi.org": 10,
+    "scholar.google.com": 1,
+}
+DEFAULT_RATE = 5
+
+# Address of a bench/replay.py server. When set, every request is sent there instead of the real
+# host, still rate limited and queued as if it went to the real host.
+REPLAY_URL = os.getenv("REPLAY_URL")
+
+# Author whose scrape issued the current request, used to queue requests fairly across authors.
+current_owner = contextvars.ContextVar("current_owner", default=None)
+# Event loop time by which every request issued from the current context must have finished.
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` acquisitions per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Reserve a token up front; a negative balance is the queue of callers already waiting.
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class FairLimiter:
+    """Caps the number of concurrent requests, handing out free slots round-robin across owners.
+
+    A single author with thousands of queued pages therefore can't starve the other authors of a batch.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters: OrderedDict[object, deque] = OrderedDict()
+
+    async def acquire(self, owner=None):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(owner, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before cancellation, hand it on.
+                self.release()
+            elif (queue := self.waiters.get(owner)) is not None:
+                if future in queue:
+                    queue.remove(future)
+                if not queue:
+                    del self.waiters[owner]
+            raise
+
+    def release(self):
+        self.active -= 1
+        while self.waiters and self.active < self.limit:
+            owner, queue = next(iter(self.waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self.waiters.move_to_end(owner)
+            else:
+                del self.waiters[owner]
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+
+class Scheduler:
+    """Shared gate for every outbound request.
+
+    A request first waits for a connection slot on its host and for the host's rate limit, then for a
+    slot under the global connection cap. Both slot queues are fair across authors.
+    """
+
+    def __init__(self, max_connections: int = 64, host_connections: int = 6, rates: dict = None):
+        self.limiter = FairLimiter(max_connections)
+        self.host_connections = host_connections
+        self.rates = HOST_RATES | (rates or {})
+        self.hosts: dict[str, FairLimiter] = {}
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def host(self, host: str):
+        if host not in self.hosts:
+            self.hosts[host] = FairLimiter(self.host_connections)
+            self.buckets[host] = TokenBucket(self.rates.get(host, DEFAULT_RATE))
+        return self.hosts[host], self.buckets[host]
+
+    @asynccontextmanager
+    async def slot(self, url: str, deadline: float = None):
+        owner = current_owner.get()
+        limiter, bucket = self.host(urlsplit(url).hostname or "")
+        async with asyncio.timeout_at(deadline):
+            await limiter.acquire(owner)
+        try:
+            async with asyncio.timeout_at(deadline):
+                await bucket.acquire()
+                await self.limiter.acquire(owner)
+            try:
+                yield
+            finally:
+                self.limiter.release()
+        finally:
+            limiter.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.limiter.active,
+            "queued": sum(len(queue) for queue in self.limiter.waiters.values()),
+            "hosts": {
+                host: {"active": limiter.active, "queued": sum(len(queue) for queue in limiter.waiters.values())}
+                for host, limiter in self.hosts.items()
+                if limiter.active or limiter.waiters
+            },
+        }
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Session meant to live as long as the application, so that pooled connections, TLS sessions
+    and DNS lookups are reused across authors and requests."""
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv("SCRAPER_MAX_CONNECTIONS", 64)),
+        # Under replay every host is the same server, the scheduler still caps each real host.
+        limit_per_host=0 if REPLAY_URL else int(os.getenv("SCRAPER_HOST_CONNECTIONS", 6)),
+        ttl_dns_cache=int(os.getenv("SCRAPER_DNS_TTL", 300)),
+        keepalive_timeout=float(os.getenv("SCRAPER_KEEPALIVE", 30)),
+        enable_cleanup_closed=True,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=float(os.getenv("SCRAPER_TIMEOUT", 30)),
+        connect=float(os.getenv("SCRAPER_CONNECT_TIMEOUT", 10)),
+        sock_read=float(os.getenv("SCRAPER_READ_TIMEOUT", 20)),
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={"Accept-Encoding": "gzip, deflate"},
+        auto_decompress=True,
+    )
+
+
+def create_scheduler() -> Scheduler:
+    return Scheduler(
+        max_connections=int(os.getenv("SCRAPER_MAX_CONNECTIONS", 64)),
+        host_connections=int(os.getenv("SCRAPER_HOST_CONNECTIONS", 6)),
+    )
+
+
+scheduler = create_scheduler()
+
+
+def replay_url(url: str) -> str:
+    """`https://host/path?query` -> `REPLAY_URL/host/path?query`."""
+    parts = urlsplit(url)
+    return f"{REPLAY_URL.rstrip('/')}/{parts.netloc}{parts.path or '/'}" + (f"?{parts.query}" if parts.query else "")
+
+
+def remaining(deadline: float = None) -> float:
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+@asynccontextmanager
+async def fetch(session: aiohttp.ClientSession, url: str, method: str = "GET", **kwargs):
+    """Drop-in replacement for `session.get`/`session.post` that goes through the shared scheduler.
+
+    Honours `request_deadline`: time spent queueing counts against it and the request itself gets
+    whatever is left as its total timeout. Raises `TimeoutError` once the deadline has passed.
+    """
+    deadline = request_deadline.get()
+    if deadline is not None and remaining(deadline) <= 0:
+        raise TimeoutError(f"Deadline exceeded before requesting {url}")
+
+    host = urlsplit(url).hostname or ""
+    queued = time.perf_counter()
+    async with scheduler.slot(url, deadline):
+        started = time.perf_counter()
+        queue_seconds.labels(host=host).observe(started - queued)
+        if deadline is not None and "timeout" not in kwargs:
+            timeout = session.timeout
+            total = min(remaining(deadline), timeout.total or float("inf"))
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=max(total, 0.01), connect=timeout.connect, sock_read=timeout.sock_read, sock_connect=timeout.sock_connect)
+        status = "error"
+        try:
+            with span("fetch", host=host, method=method):
+                async with session.request(method, replay_url(url) if REPLAY_URL else url, **kwargs) as response:
+                    status = str(response.status)
+                    yield response
+        finally:
+            request_seconds.labels(host=host).observe(time.perf_counter() - started)
+            request_total.labels(host=host, status=status).inc()
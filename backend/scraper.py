@@ -1,207 +1,217 @@
 import asyncio
+import contextvars
 import os
-import time
+from datetime import date
+from functools import partial
 from itertools import chain
 from urllib.parse import quote
 
 import aiohttp
 import feedparser
-from bs4 import BeautifulSoup
+from analytics import analytics
+from cache import fetch_abstract, result_cache
+from catalog import catalog
+from dedup import Deduplicator, dedupe
 from dotenv import load_dotenv
+from instrumentation import author_seconds, source_seconds, span, timed
+from parsers import DblpParser, parse, parse_acmdl, parse_links, parse_paper, parse_pubmed
+from publication import Publication
+from revalidation import revalidate
+from scheduler import create_session, current_owner, fetch, request_deadline
+from semantic import semantic_index
+from serpapi import QuotaExceeded, serpapi
 from utils import (
-    abstract,
     clean_abs,
     clean_author,
+    extract_source,
     extract_year,
+    name_matcher,
     random_headers,
-    to_dict,
-    valid_affil,
     valid_names,
 )
 
 load_dotenv()
-SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+
+
+# Upper bound on how long each source may take, in seconds.
+SOURCE_TIMEOUTS = {
+    "scholar": 45,
+    "nature": 40,
+    "biorxiv": 40,
+    "inspire": 30,
+    "pubmed": 30,
+    "dblp": 30,
+    "arxiv": 20,
+    "acmdl": 20,
+}
+DEFAULT_SOURCE_TIMEOUT = float(os.getenv("SCRAPER_SOURCE_TIMEOUT", 30))
+# Sources are cancelled this long after their deadline, so that in-flight page fetches can time out
+# first and the source still returns whatever it already has.
+DEADLINE_GRACE = 1.0
+DBLP_CHUNK_SIZE = 64 * 1024
+# Newest results asked of the sources that can sort by date, when only publications since a year are wanted.
+RECENT_RESULTS = 50
+
+# Relative cost of fetching an abstract from each kind of landing page. Pages are tried cheapest
+# first; sources missing here (e.g. openreview) are never fetched.
+LANDING_COST = {
+    "arxiv": 1,
+    "pubmed": 1,
+    "inspire": 1,
+    "jmlr": 2,
+    "neurips": 2,
+    "acmdl": 2,
+    "mdpi": 2,
+    "frontiers": 2,
+    "biorxiv": 3,
+    "nature": 3,
+    "ieee": 3,
+    "scholar": 5,
+}
+
+# Set by `gathered` in the task running a source when some of its per-paper workers ran out of time.
+truncated = contextvars.ContextVar("truncated", default=False)
+
+
+def gathered(results: list) -> list[Publication]:
+    # Per-paper workers return None for pages of other authors, and exceptions for failed pages.
+    if any(isinstance(i, TimeoutError) for i in results):
+        truncated.set(True)
+    return [i for i in results if isinstance(i, Publication)]
 
 
 async def linker(session: aiohttp.ClientSession, author: str) -> list[tuple]:
-    url = f"https://serpapi.com/search?engine=google_scholar&q=author:{quote(author)}&api_key={SERPAPI_KEY}"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.json()
-            articles = response["organic_results"]
-            linkmap = {i["title"]: i.get("link", "") for i in articles}
-            return linkmap
-    return {}
+    response = await serpapi.search(session, {"engine": "google_scholar", "q": f"author:{author}"})
+    if response is None:
+        return {}
+    return {i["title"]: i.get("link", "") for i in response.get("organic_results", [])}
 
 
 async def scholar(session: aiohttp.ClientSession, author: str, affiliation: str = None) -> list[tuple]:
-    url = f"https://serpapi.com/search.json?engine=google_scholar_profiles&mauthors={quote(author)}&api_key={SERPAPI_KEY}"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.json()
-
-            if affiliation:
-                for profile in response["profiles"]:
-                    if valid_names([profile["name"]], author, 80):
-                        if valid_affil(affiliation, profile["affiliations"]):
-                            author_id = profile["author_id"]
-                            break
-                else:
-                    return []
-            else:
-                profile = response["profiles"][0]
-                if valid_names([profile["name"]], author, 80):
-                    author_id = profile["author_id"]
-                else:
-                    return []
-
-            results, tasks = [], []
-            url = f"https://serpapi.com/search.json?engine=google_scholar_author&author_id={author_id}&api_key={SERPAPI_KEY}"
-            async with session.get(url, headers=random_headers()) as response:
-                response = await response.json()
-                table = response["cited_by"]["table"]
-                info = response["author"] | {"graph": response["cited_by"]["graph"]} | table[0] | table[1] | table[2]
-
-                articles = response["articles"]
-                for i in articles:
-                    authors = [clean_author(author) for author in i["authors"].split(",")]
-                    title = i["title"]
-                    year = extract_year(i["year"])
-                    link = i["link"]
-                    tasks.append(abstract(session, link, "scholar"))
-                    results.append(("scholar", title, year, authors, link))
-                abstracts = await asyncio.gather(*tasks)
-                results = [to_dict(a, b, c, d, e, f) for (a, b, c, d, e), f in zip(results, abstracts)]
-                return [results, info]
+    if (author_id := await serpapi.author_id(session, author, affiliation)) is None:
+        return []
+    if (response := await serpapi.author(session, author_id)) is None:
+        return []
+    table = response["cited_by"]["table"]
+    info = response["author"] | {"graph": response["cited_by"]["graph"]} | table[0] | table[1] | table[2]
 
-    return []
+    results = []
+    for i in response["articles"]:
+        authors = [clean_author(author) for author in i["authors"].split(",")]
+        title = i["title"]
+        year = extract_year(i["year"])
+        link = i["link"]
+        # Abstracts are filled in later by resolve_abstracts, only for papers no other source covered.
+        results.append(Publication("scholar", title, year, authors, link, None))
+    return [results, info]
 
 
 async def dblp(session: aiohttp.ClientSession, author: str) -> list[tuple]:
-    t = time.time()
     url = f"https://dblp.org/search/author/api?q={quote(author)}&format=json"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            data = await response.json()
-            hits = data.get("result", {}).get("hits", {}).get("hit", {})
-            for i in hits:
-                info = i["info"]
-                tempauthor = clean_author(info["author"])
-                if valid_names([tempauthor], author):
-                    url = info.get("url") + ".xml"
-                    print(url, time.time() - t)
-                    async with session.get(url, headers=random_headers()) as response:
-                        res = await response.read()
-                        soup = BeautifulSoup(res, features="xml")
-                        articles = soup.find_all("article")
-                        source = ["dblp"] * len(articles)
-                        titles = [i.find("title").text.strip() for i in articles]
-                        years = [extract_year(i.find("year").text) for i in articles]
-                        authors = [[author.text for author in i.find_all("author")] for i in articles]
-                        links = [i.find("ee").text for i in articles]
-                        tasks = [abstract(session, link) for link in links]
-                        abstracts = await asyncio.gather(*tasks)
-                        results = list(zip(source, titles, years, authors, links, abstracts))
-                        return [to_dict(*i) for i in results if i]
-        return []
+    hits = await revalidate(
+        session, url, "dblp-search", read=lambda response: response.json(), parse=lambda data: [i["info"] for i in data.get("result", {}).get("hits", {}).get("hit", {})], headers=random_headers()
+    )
+
+    for info in hits or []:
+        tempauthor = clean_author(info["author"])
+        if valid_names([tempauthor], author):
+            records = await revalidate(session, info.get("url") + ".xml", "dblp-person", read=dblp_records, headers=random_headers())
+            return [Publication("dblp", title, extract_year(year), authors, link, None) for title, year, authors, link in records or []]
+    return []
 
 
-async def arxiv(session: aiohttp.ClientSession, author: str) -> list[tuple]:
-    url = f"https://export.arxiv.org/api/query?search_query=au:{quote(author)}"
-    results = []
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            content = await response.read()
-            articles = feedparser.parse(content)["entries"]
-            for i in articles:
-                authors = [clean_author(author["name"]) for author in i["authors"]]
-                if valid_names(authors, author):
-                    title = i["title"]
-                    year = extract_year(i["published"])
-                    link = i["link"]
-                    abstract = clean_abs(i["summary"])
-                    results.append(to_dict("arxiv", title, year, authors, link, abstract))
-    return results
+async def dblp_records(response: aiohttp.ClientResponse) -> list[tuple]:
+    records = []
+    parser = DblpParser()
+    async for chunk in response.content.iter_chunked(DBLP_CHUNK_SIZE):
+        records.extend(parser.feed(chunk))
+    records.extend(parser.close())
+    return records
 
 
-async def pubmed(session: aiohttp.ClientSession, author: str) -> list[tuple]:
+async def arxiv(session: aiohttp.ClientSession, author: str, since: int = None) -> list[tuple]:
+    url = f"https://export.arxiv.org/api/query?search_query=au:{quote(author)}"
+    if since:
+        url += f"&sortBy=submittedDate&sortOrder=descending&max_results={RECENT_RESULTS}"
+    results = []
+    # Only the fields used below, feedparser entries hold dates that don't serialize.
+    fields = ("title", "published", "link", "summary")
+    articles = await revalidate(
+        session, url, "arxiv", parse=lambda content: [{key: i[key] for key in fields} | {"authors": [j["name"] for j in i["authors"]]} for i in feedparser.parse(content)["entries"]], headers=random_headers()
+    )
+    if articles:
+        names = [[clean_author(name) for name in i["authors"]] for i in articles]
+        for i, authors, valid in zip(articles, names, name_matcher(author).match_many(names)):
+            if valid:
+                title = i["title"]
+                year = extract_year(i["published"])
+                link = i["link"]
+                abstract = clean_abs(i["summary"])
+                results.append(Publication("arxiv", title, year, authors, link, abstract))
+    return recent(results, since)
+
+
+async def pubmed(session: aiohttp.ClientSession, author: str, since: int = None) -> list[tuple]:
     url = f"https://pubmed.ncbi.nlm.nih.gov/?term=%28{quote(author)}%5BAuthor%5D&sort="
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            results, tasks = [], []
-            response = await response.text()
-
-            soup = BeautifulSoup(response, "lxml")
-            baseurl = "https://pubmed.ncbi.nlm.nih.gov/"
-            articles = soup.find_all("article", {"class": "full-docsum"})
-            for i in articles:
-                authors = [clean_author(i) for i in i.find("span", {"class": "docsum-authors full-authors"}).text.split(",")]
-                if valid_names(authors, author):
-                    title = i.find("a", {"class": "docsum-title"}).text.strip()
-                    year = extract_year(i.find("span", {"class": "docsum-journal-citation short-journal-citation"}).text.strip())
-                    link = baseurl + i.find("span", {"class": "citation-part"}).text.split()[-1]
-                    tasks.append(abstract(session, link, "pubmed"))
-                    results.append(("pubmed", title, year, authors, link))
-
-            abstracts = await asyncio.gather(*tasks)
-            return [to_dict(a, b, c, d, e, f) for (a, b, c, d, e), f in zip(results, abstracts)]
+    if since:
+        url += f"date&filter=years.{since}-{date.today().year}"
+    if (articles := await revalidate(session, url, "pubmed", parse=partial(parse, parse_pubmed), headers=random_headers())) is None:
         return []
 
+    results = []
+    baseurl = "https://pubmed.ncbi.nlm.nih.gov/"
+    names = [[clean_author(i) for i in authors] for authors, _, _, _ in articles]
+    for (_, title, year, pmid), authors, valid in zip(articles, names, name_matcher(author).match_many(names)):
+        if valid:
+            results.append(Publication("pubmed", title, extract_year(year), authors, baseurl + pmid, None))
+    return recent(results, since)
+
 
-async def inspire(session: aiohttp.ClientSession, author: str) -> list[tuple]:
+async def inspire(session: aiohttp.ClientSession, author: str, since: int = None) -> list[tuple]:
     url = f"https://inspirehep.net/api/literature?sort=mostrecent&size=50&page=1&q=a%3A{quote(author)}"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.json()
-            links = [i["links"]["json"] for i in response["hits"]["hits"]]
-            tasks = [worker(session, link, "inspire", author) for link in links]
-            return await asyncio.gather(*tasks)
+    if since:
+        url += quote(f" and de >= {since}")
+    # Returns with the response released, the workers need this host's connection slots.
+    links = await revalidate(session, url, "inspire-search", read=lambda response: response.json(), parse=lambda data: [i["links"]["json"] for i in data["hits"]["hits"]], headers=random_headers())
+    if links is None:
         return []
+    tasks = [worker(session, link, "inspire", author) for link in links]
+    return recent(gathered(await asyncio.gather(*tasks, return_exceptions=True)), since)
 
 
 async def acmdl(session: aiohttp.ClientSession, author: str) -> list[tuple]:
     url = f"https://dl.acm.org/action/doSearch?fillQuickSearch=false&target=advanced&expand=dl&field1=ContribAuthor&text1={quote(author)}"
     results = []
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.read()
-            soup = BeautifulSoup(response, "lxml")
-            articles = soup.find_all("li", {"class": "search__item issue-item-container"})
-            for i in articles:
-                authors = [clean_author(j.text) for j in i.find_all("span", {"class": "hlFld-ContribAuthor"})]
-                if valid_names(authors, author):
-                    title = i.find("span", {"class": "hlFld-Title"}).text.strip()
-                    year = extract_year(i.find("div", {"class": "bookPubDate simple-tooltip__block--b"}).text)
-                    link = "https://dl.acm.org" + i.find("span", {"class": "hlFld-Title"}).find("a").get("href")
-                    abstract = clean_abs(i.find("div", {"class": "issue-item__abstract truncate-text"}).text.strip())
-                    results.append(to_dict("acmdl", title, year, authors, link, abstract))
+    if (articles := await revalidate(session, url, "acmdl", parse=partial(parse, parse_acmdl), headers=random_headers())) is None:
+        return results
+
+    names = [[clean_author(j) for j in authors] for authors, _, _, _, _ in articles]
+    for (_, title, year, href, abstract), authors, valid in zip(articles, names, name_matcher(author).match_many(names)):
+        if valid:
+            results.append(Publication("acmdl", title, extract_year(year), authors, "https://dl.acm.org" + href, clean_abs(abstract)))
     return results
 
 
 async def biorxiv(session: aiohttp.ClientSession, author: str) -> list[tuple]:
     url = f"https://www.biorxiv.org/search/%20author1%3A{quote(author)}%20jcode%3Abiorxiv%20numresults%3A75%20sort%3Arelevance-rank%20format_result%3Astandard"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.read()
-            soup = BeautifulSoup(response, "lxml")
-            baseurl = "https://www.biorxiv.org"
-            links = [baseurl + i.get("href", None) for i in soup.find_all("a", {"class": "highwire-cite-linked-title"})]
-            tasks = [worker(session, link, "biorxiv", author) for link in links]
-            return await asyncio.gather(*tasks)
-    return None
+    if (hrefs := await revalidate(session, url, "biorxiv-search", parse=lambda raw: parse(parse_links, raw, "highwire-cite-linked-title"), headers=random_headers())) is None:
+        return None
+
+    baseurl = "https://www.biorxiv.org"
+    links = [baseurl + href for href in hrefs]
+    tasks = [worker(session, link, "biorxiv", author) for link in links]
+    return gathered(await asyncio.gather(*tasks, return_exceptions=True))
 
 
 async def nature(session: aiohttp.ClientSession, author: str) -> list[tuple]:
     url = f"https://www.nature.com/search?author={quote(author)}&order=relevance"
-    async with session.get(url, headers=random_headers()) as response:
-        if response.status == 200:
-            response = await response.read()
-            soup = BeautifulSoup(response, "lxml")
-            baseurl = "https://www.nature.com"
-            links = [baseurl + i.get("href", None) for i in soup.find_all("a", {"class": "c-card__link u-link-inherit"})]
-            tasks = [worker(session, link, "nature", author) for link in links]
-            return await asyncio.gather(*tasks)
-    return None
+    if (hrefs := await revalidate(session, url, "nature-search", parse=lambda raw: parse(parse_links, raw, "c-card__link u-link-inherit"), headers=random_headers())) is None:
+        return None
+
+    baseurl = "https://www.nature.com"
+    links = [baseurl + href for href in hrefs]
+    tasks = [worker(session, link, "nature", author) for link in links]
+    return gathered(await asyncio.gather(*tasks, return_exceptions=True))
 
 
 ### NOTE - IEEE and Scopus need Institute Ethernet for access
@@ -217,7 +227,7 @@ async def ieee(session: aiohttp.ClientSession, author: str) -> list[tuple]:
 
     payload = {"newsearch": True, "queryText": f'("Authors":{quote(author)})', "highlight": True, "returnFacets": ["ALL"], "returnType": "SEARCH", "matchPubs": True}
 
-    async with session.post(url, headers=headers, json=payload) as response:
+    async with fetch(session, url, "POST", headers=headers, json=payload) as response:
         if response.status == 200:
             response = await response.read()
             # print(response)
@@ -241,56 +251,246 @@ async def worker(session: aiohttp.ClientSession, url: str, source: str, author:
     Returns:
         list[tuple]: list of features.
     """
-    async with session.get(url) as response:
-        if response.status == 200:
-            if source == "inspire":
-                res = await response.json()
-                metadata = res["metadata"]
-                authors = [clean_author(i["full_name"]) for i in metadata["authors"]]
-                if valid_names(authors, author):
-                    title = metadata["titles"][0]["title"]
-                    year = metadata.get("publication_info", [{}])[0].get("year") or metadata.get("imprints", [{}])[0].get("date") or metadata.get("preprint_date")
-                    link = url.replace("/api", "").replace("?format=json", "")
-                    try:
-                        abstract = metadata["abstracts"][0]["value"]
-                    except:
-                        abstract = None
-                    return to_dict(source, title, extract_year(year), authors, link, clean_abs(abstract))
-
-            elif source == "biorxiv":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                authors = [clean_author(i.text) for i in soup.find_all("span", {"class": "highwire-citation-author"})]
-                if valid_names(authors, author):
-                    title = soup.find("h1", {"class": "highwire-cite-title"}).text.strip()
-                    year = soup.find("div", {"class": "panel-pane pane-custom pane-1"}).text
-                    abstract = soup.find("div", {"class": "highwire-markup"})
-                    return to_dict(source, title, extract_year(year), authors, url, clean_abs(abstract))
-
-            elif source == "nature":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                authors = [clean_author(i.text) for i in soup.find_all("li", {"class": "c-article-author-list__item"})]
-                if valid_names(authors, author):
-                    year = soup.find("time").text
-                    title = soup.find("h1", {"class": "c-article-title"}).text.strip()
-                    abstract = soup.find("div", {"id": "Abs1-content", "class": "c-article-section__content"})
-                    return to_dict(source, title, extract_year(year), authors, url, clean_abs(abstract))
+    if source == "inspire":
+        paper = await revalidate(session, url, "paper", read=lambda response: response.json(), parse=inspire_record)
+    else:
+        paper = await revalidate(session, url, "paper", parse=partial(parse, parse_paper, source))
+    if paper is None:
+        return None
+
+    authors = [clean_author(i) for i in paper["authors"]]
+    if valid_names(authors, author):
+        link = url.replace("/api", "").replace("?format=json", "") if source == "inspire" else url
+        return Publication(source, paper["title"], extract_year(paper["year"]), authors, link, clean_abs(paper["abstract"]))
     return None
 
 
-async def main(author, affiliation=None, functions: list = None):
-    async with aiohttp.ClientSession() as session:
-        if not functions:
-            functions = [arxiv, pubmed, acmdl, biorxiv, nature]
-        tasks = [function(session, author) for function in functions]
-        sres = await scholar(session, author, affiliation)
-        results = await asyncio.gather(*tasks)
-        results = [result for result in results if result is not None]
-        return {"data": list(chain.from_iterable(results)) + sres[0], "info": sres[1]}
+def inspire_record(data: dict) -> dict:
+    """An inspire literature record in the shape of `parsers.parse_paper`, without the rest of its metadata."""
+    metadata = data["metadata"]
+    year = metadata.get("publication_info", [{}])[0].get("year") or metadata.get("imprints", [{}])[0].get("date") or metadata.get("preprint_date")
+    try:
+        abstract = metadata["abstracts"][0]["value"]
+    except:
+        abstract = None
+    return {"authors": [i["full_name"] for i in metadata["authors"]], "title": metadata["titles"][0]["title"], "year": year, "abstract": abstract}
 
 
-async def multimain(authors: list[str], affiliation=None):
-    tasks = [main(author, affiliation) for author in authors]
+# Sources /query scrapes unless told otherwise, Scholar aside.
+DEFAULT_FUNCTIONS = [arxiv, pubmed, acmdl, biorxiv, nature]
+
+
+async def collect(author, affiliation=None, functions: list = None, session: aiohttp.ClientSession = None, deadline: float = None):
+    """Yield `(source, result, status)` for an author as each source finishes, cached sources first.
+
+    `scholar` always runs alongside `functions` and yields `[publications, info]` (or `[]`).
+    `deadline` is a budget in seconds for the whole author; sources that run out of time are cancelled.
+    `status` is one of ok / partial / timeout / error / skipped, and `result` is None unless it's ok
+    or partial. Partial results, where the deadline cut off some of a source's paper pages, aren't cached.
+    """
+    if session is None:
+        async with create_session() as session:
+            async for item in collect(author, affiliation, functions, session, deadline):
+                yield item
+        return
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline if deadline is not None else None
+    current_owner.set(author)
+    if not functions:
+        functions = DEFAULT_FUNCTIONS
+
+    pending = {}
+    for name, call in [(f.__name__, partial(f, session, author)) for f in functions] + [("scholar", partial(scholar, session, author, affiliation))]:
+        cached = result_cache.get(author, affiliation, name)
+        if cached is None:
+            pending[name] = call
+        else:
+            yield name, revive(name, cached), "ok"
+
+    async def run(name, call):
+        source_end = loop.time() + SOURCE_TIMEOUTS.get(name, DEFAULT_SOURCE_TIMEOUT)
+        if end is not None:
+            if end <= loop.time():
+                return name, None, "skipped"
+            source_end = min(source_end, end)
+        # Runs in its own task, so this only bounds the requests made by this source.
+        request_deadline.set(source_end)
+        truncated.set(False)
+        started = loop.time()
+        status = "ok"
+        try:
+            with span("source", source=name, author=author):
+                async with asyncio.timeout_at(source_end + DEADLINE_GRACE):
+                    result = await call()
+            if truncated.get():
+                status = "partial"
+                return name, result, status
+        except TimeoutError:
+            status = "timeout"
+            return name, None, status
+        except QuotaExceeded:
+            status = "skipped"
+            return name, None, status
+        except Exception:
+            status = "error"
+            return name, None, status
+        finally:
+            source_seconds.labels(source=name, status=status).observe(loop.time() - started)
+        result_cache.set(author, result, affiliation, name)
+        return name, result, status
+
+    tasks = [asyncio.create_task(run(name, call)) for name, call in pending.items()]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def recent(records: list[Publication], since: int = None) -> list[Publication]:
+    """Publications from `since` on, and those without a year, which may be just as new."""
+    if not since:
+        return records
+    return [record for record in records if record.year is None or record.year >= since]
+
+
+def publications(result) -> list[Publication]:
+    return [i for i in result or [] if i]
+
+
+def revive(name: str, result):
+    """Turn a source result read back from the persistent cache, where publications are dicts, into Publications."""
+    if name == "scholar":
+        return [[Publication.load(i) for i in result[0]], result[1]] if result else result
+    return [Publication.load(i) for i in publications(result)]
+
+
+def landing_pages(record: Publication) -> list[tuple]:
+    """(link, source) of every landing page an abstract could be fetched from, cheapest first."""
+    pages = []
+    for link, source in zip(record.links, record.sources):
+        if not link:
+            continue
+        hint = source if source in ("scholar", "pubmed") else None
+        if (landing := hint or extract_source(link)) and landing in LANDING_COST:
+            pages.append((LANDING_COST[landing], link, hint))
+    return [(link, hint) for _, link, hint in sorted(pages, key=lambda page: page[0])]
+
+
+async def resolve_abstracts(session: aiohttp.ClientSession, records: list[Publication], end: float = None) -> list[Publication]:
+    """Fill in missing abstracts of deduplicated records, fetching the cheapest landing page of each
+    first. Returns the records that gained an abstract."""
+
+    async def resolve(record):
+        # Runs in its own task, see collect.
+        request_deadline.set(end)
+        for link, source in landing_pages(record):
+            if abstract := await fetch_abstract(session, link, source):
+                record.abstract = abstract
+                return True
+        return False
+
+    missing = [record for record in records if not record.abstract]
+    filled = await asyncio.gather(*[resolve(record) for record in missing])
+    return [record for record, ok in zip(missing, filled) if ok]
+
+
+async def run_resolution(session: aiohttp.ClientSession, records: list[Publication], end: float = None) -> tuple[list[Publication], str]:
+    if end is not None and end <= asyncio.get_running_loop().time():
+        return [], "skipped"
+    try:
+        async with asyncio.timeout_at(end + DEADLINE_GRACE if end is not None else None):
+            return await resolve_abstracts(session, records, end), "ok"
+    except TimeoutError:
+        return [], "timeout"
+
+
+async def save(author: str, response: dict, affiliation=None):
+    """Keep the finished result of an author for the endpoints serving stored data."""
+    # Cached so that /summary can refer to the result instead of the client uploading it again.
+    result_cache.set(author, response, affiliation, "query")
+    # Multi-row transactions, kept off the event loop like indexing.
+    await asyncio.to_thread(catalog.replace, author, response["data"], affiliation)
+    await asyncio.to_thread(analytics.update, author, response["data"], affiliation, response["info"])
+    await asyncio.to_thread(semantic_index.add, author, response["data"])
+
+
+async def main(author, affiliation=None, functions: list = None, session: aiohttp.ClientSession = None, deadline: float = None):
+    if session is None:
+        async with create_session() as session:
+            return await main(author, affiliation, functions, session, deadline)
+
+    end = asyncio.get_running_loop().time() + deadline if deadline is not None else None
+    results, sres, status = {}, [], {}
+    with timed(author_seconds), span("author", author=author, affiliation=affiliation):
+        async for name, result, state in collect(author, affiliation, functions, session, deadline):
+            status[name] = state
+            if name == "scholar":
+                sres = result
+            else:
+                results[name] = publications(result)
+        data = list(chain.from_iterable(results[f.__name__] for f in functions or DEFAULT_FUNCTIONS))
+        data = dedupe(data + (sres[0] if sres else []))
+        _, status["abstracts"] = await run_resolution(session, data, end)
+    response = {"data": data, "info": sres[1] if sres else None, "status": status}
+    await save(author, response, affiliation)
+    return response
+
+
+async def multimain(authors: list[str], affiliation=None, session: aiohttp.ClientSession = None, deadline: float = None, functions: list = None):
+    if session is None:
+        async with create_session() as session:
+            return await multimain(authors, affiliation, session, deadline, functions)
+
+    tasks = [main(author, affiliation, functions, session=session, deadline=deadline) for author in authors]
     results = await asyncio.gather(*tasks)
     return dict(zip(authors, results))
+
+
+async def stream_multimain(authors: list[str], affiliation=None, session: aiohttp.ClientSession = None, deadline: float = None):
+    """Yield one frame per (author, source) as soon as it's ready, then a `done` frame per author
+    carrying the scholar info block and the status of every source.
+
+    Publications are deduplicated per author as they arrive: `data` holds the ones not seen before and
+    `merged` the earlier ones that a duplicate in this frame was folded into. Once every source is in,
+    an `abstracts` frame lists the records whose missing abstract was fetched.
+    """
+    if session is None:
+        async with create_session() as session:
+            async for frame in stream_multimain(authors, affiliation, session, deadline):
+                yield frame
+        return
+
+    queue = asyncio.Queue()
+
+    async def produce(author):
+        end = asyncio.get_running_loop().time() + deadline if deadline is not None else None
+        info, status = None, {}
+        index = Deduplicator()
+        try:
+            with timed(author_seconds), span("author", author=author, affiliation=affiliation):
+                async for name, result, state in collect(author, affiliation, session=session, deadline=deadline):
+                    status[name] = state
+                    if name == "scholar":
+                        info = result[1] if result else None
+                        result = result[0] if result else []
+                    added, merged = index.extend(publications(result))
+                    await queue.put({"author": author, "source": name, "status": state, "data": added, "merged": merged})
+
+                filled, status["abstracts"] = await run_resolution(session, index.records, end)
+                await queue.put({"author": author, "source": "abstracts", "status": status["abstracts"], "data": [], "merged": filled})
+                await save(author, {"data": index.records, "info": info, "status": status}, affiliation)
+        finally:
+            await queue.put({"author": author, "done": True, "info": info, "status": status})
+
+    tasks = [asyncio.create_task(produce(author)) for author in authors]
+    try:
+        for _ in authors:
+            while not (frame := await queue.get()).get("done"):
+                yield frame
+            yield frame
+    finally:
+        for task in tasks:
+            task.cancel()
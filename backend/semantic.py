@@ -0,0 +1,278 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from cache import data_path, normalize_name
+from dedup import normalize_title
+from dotenv import load_dotenv
+from publication import Publication
+
+load_dotenv()
+
+SEMANTIC_PATH = os.getenv("SEMANTIC_PATH") or data_path("semantic")
+# Name of a sentence-transformers model to embed with. Unset, or without the package installed,
+# abstracts are embedded with hashed TF-IDF, which needs nothing beyond numpy.
+SEMANTIC_MODEL = os.getenv("SEMANTIC_MODEL")
+HASHING_DIM = 512
+GROWTH = 4096
+
+SOURCES = ["scholar", "dblp", "arxiv", "pubmed", "inspire", "acmdl", "biorxiv", "nature", "ieee"]
+STOPWORDS = set(
+    "a an and are as at be by for from has have in into is it its of on or our that the their these this to under using we which with".split()
+)
+
+
+def words(text: str) -> list[str]:
+    return [word for word in re.findall(r"\w+", text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+class HashingEmbedder:
+    """TF-IDF over unigrams and bigrams, hashed into a fixed number of dimensions.
+
+    Document vectors hold normalized sublinear term frequencies only, so they never need recomputing
+    as the corpus grows; IDF weights are applied to the query instead, from document frequencies
+    kept per dimension.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+
+    def features(self, text: str):
+        tokens = words(text)
+        counts = Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+        index = np.empty(len(counts), dtype=np.int64)
+        values = np.empty(len(counts), dtype=np.float32)
+        for i, (token, count) in enumerate(counts.items()):
+            h = zlib.crc32(token.encode())
+            index[i] = h % self.dim
+            values[i] = (1 + math.log(count)) * (1 if h & 0x80000000 else -1)
+        return index, values
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            index, values = self.features(text)
+            np.add.at(vectors[row], index, values)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def query(self, text: str, df: np.ndarray, count: int) -> np.ndarray:
+        idf = np.log((1 + count) / (1 + df)) + 1
+        vector = self.embed([text])[0] * idf**2
+        norm = np.linalg.norm(vector)
+        # float32 like the index, a float64 query would upcast the whole matrix on every search.
+        return (vector / norm if norm else vector).astype(np.float32)
+
+
+class ModelEmbedder:
+    def __init__(self, model: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model, device="cpu")
+        self.name = "model-" + re.sub(r"\W+", "-", model)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def query(self, text: str, df: np.ndarray, count: int) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+def create_embedder():
+    if SEMANTIC_MODEL:
+        try:
+            return ModelEmbedder(SEMANTIC_MODEL)
+        except ImportError:
+            pass
+    return HashingEmbedder()
+
+
+class SemanticIndex:
+    """On-disk vector index over the titles and abstracts of every queried author's publications.
+
+    Vectors live in a memory-mapped float32 matrix, one row per (author, paper), and metadata in
+    SQLite. Filter columns are mirrored in numpy arrays so that a filtered top-k search is a single
+    masked matrix-vector product. Re-adding an author overwrites their rows in place.
+    """
+
+    def __init__(self, path: str = SEMANTIC_PATH, embedder=None):
+        self.path = path
+        self.embedder = embedder
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        """Open the index and read its filter columns back, on first use rather than on import."""
+        with self.lock:
+            if self.loaded:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self.embedder = self.embedder or create_embedder()
+            self.dim = self.embedder.dim
+            self.conn = sqlite3.connect(os.path.join(self.path, f"{self.embedder.name}.db"), check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS items (
+                    row INTEGER PRIMARY KEY, key TEXT UNIQUE, author_key TEXT, author TEXT, title TEXT, year INTEGER,
+                    sources TEXT, link TEXT, abstract TEXT, alive INTEGER, updated REAL
+                );
+                CREATE INDEX IF NOT EXISTS items_author ON items (author_key);
+            """)
+            self.vectors_path = os.path.join(self.path, f"{self.embedder.name}.f32")
+            self.df_path = os.path.join(self.path, f"{self.embedder.name}.df.npy")
+            self.df = np.load(self.df_path) if os.path.exists(self.df_path) else np.zeros(self.dim, dtype=np.float64)
+
+            rows = self.conn.execute("SELECT row, author_key, year, sources, alive FROM items ORDER BY row").fetchall()
+            self.size = rows[-1][0] + 1 if rows else 0
+            self.capacity = 0
+            self.vectors = None
+            self.authors: dict[str, int] = {}
+            self.author_ids = np.zeros(0, dtype=np.int32)
+            self.years = np.zeros(0, dtype=np.int16)
+            self.source_masks = np.zeros(0, dtype=np.int32)
+            self.alive = np.zeros(0, dtype=bool)
+            self.grow(self.size)
+            for row, author_key, year, sources, alive in rows:
+                self.set_filters(row, author_key, year, sources.split(","), bool(alive))
+            self.loaded = True
+
+    def grow(self, size: int):
+        if size <= self.capacity and self.vectors is not None:
+            return
+        capacity = max(GROWTH, self.capacity)
+        while capacity < size:
+            capacity *= 2
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        for name in ("author_ids", "years", "source_masks", "alive"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def source_mask(self, sources: list[str]) -> int:
+        mask = 0
+        for source in sources:
+            mask |= 1 << (SOURCES.index(source) if source in SOURCES else len(SOURCES))
+        return mask
+
+    def set_filters(self, row: int, author_key: str, year: int, sources: list[str], alive: bool = True):
+        self.author_ids[row] = self.authors.setdefault(author_key, len(self.authors))
+        self.years[row] = year or 0
+        self.source_masks[row] = self.source_mask(sources)
+        self.alive[row] = alive
+
+    def add(self, author: str, records: list[Publication]) -> int:
+        """Index the publications of an author, replacing the ones indexed for them before."""
+        self.load()
+        author_key = normalize_name(author)
+        records = [record for record in records if record.title]
+        texts = [f"{record.title}. {record.abstract or ''}" for record in records]
+        vectors = self.embedder.embed(texts) if texts else np.zeros((0, self.dim), dtype=np.float32)
+        now = time.time()
+
+        with self.lock:
+            existing = dict(self.conn.execute("SELECT key, row FROM items WHERE author_key = ?", (author_key,)).fetchall())
+            keep = set()
+            with self.conn:
+                self.conn.execute("BEGIN")
+                for record, vector in zip(records, vectors):
+                    key = f"{author_key}\0{normalize_title(record.title)}"
+                    if key in keep:
+                        continue
+                    keep.add(key)
+                    if (row := existing.get(key)) is None:
+                        row = self.size
+                        self.size += 1
+                        self.grow(self.size)
+                        # Document frequencies count every row once, when it's first indexed.
+                        self.df[np.flatnonzero(vector)] += 1
+                    sources = record.sources or [record.source]
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)",
+                        (row, key, author_key, author, record.title, record.year, ",".join(sources), record.link, record.abstract, now),
+                    )
+                    self.set_filters(row, author_key, record.year, sources)
+                    self.vectors[row] = vector
+                for key, row in existing.items():
+                    if key not in keep:
+                        self.conn.execute("UPDATE items SET alive = 0 WHERE row = ?", (row,))
+                        self.alive[row] = False
+            self.vectors.flush()
+            np.save(self.df_path, self.df)
+        return len(keep)
+
+    def search(self, text: str, k: int = 10, authors: list[str] = None, year_from: int = None, year_to: int = None, sources: list[str] = None) -> list[dict]:
+        """Top `k` indexed publications most similar to `text`, restricted to the given filters.
+
+        Without an author filter, a paper indexed for several of its co-authors is returned once.
+        """
+        self.load()
+        # Only the filters are read under the lock; rows below `size` are complete, and an author being
+        # re-added while the matrix is scored at worst changes a score.
+        with self.lock:
+            size = self.size
+            mask = self.alive[:size].copy()
+            if authors:
+                ids = [self.authors[key] for key in map(normalize_name, authors) if key in self.authors]
+                mask &= np.isin(self.author_ids[:size], ids)
+            if year_from is not None:
+                mask &= self.years[:size] >= year_from
+            if year_to is not None:
+                mask &= (self.years[:size] <= year_to) & (self.years[:size] > 0)
+            if sources:
+                mask &= (self.source_masks[:size] & self.source_mask(sources)) != 0
+            vectors, df = self.vectors, self.df.copy()
+
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return []
+        query = self.embedder.query(text, df, size)
+        # Gathering rows copies them, which costs more than scoring the whole mapped matrix unless the filters are selective.
+        scores = (vectors[:size] @ query)[rows] if len(rows) > size // 4 else vectors[rows] @ query
+
+        # Duplicates take up some of the best rows, so look further until `k` distinct papers are found.
+        limit = k
+        while True:
+            top = np.argpartition(-scores, min(limit, len(rows)) - 1)[:limit] if len(rows) > limit else np.arange(len(rows))
+            top = top[np.argsort(-scores[top])]
+            # Nothing in common with the query at all, not worth returning.
+            top = top[scores[top] > 0]
+            if not len(top):
+                return []
+            found = {row: score for row, score in zip(rows[top].tolist(), scores[top].tolist())}
+            items = self.conn.execute(
+                f"SELECT row, key, author, title, year, sources, link, abstract FROM items WHERE row IN ({', '.join('?' * len(found))})", list(found)
+            ).fetchall()
+            items.sort(key=lambda item: -found[item[0]])
+            if not authors:
+                # Keys are the author and the normalized title, the best scoring copy of each title is kept.
+                unique = {}
+                for item in items:
+                    unique.setdefault(item[1].split("\0", 1)[1], item)
+                items = list(unique.values())
+            if len(items) >= k or len(top) < limit or limit >= len(rows):
+                break
+            limit *= 4
+        return [
+            {"score": round(found[row], 4), "author": author, "title": title, "year": year, "sources": sources.split(","), "link": link, "abstract": abstract}
+            for row, _, author, title, year, sources, link, abstract in items[:k]
+        ]
+
+    def stats(self) -> dict:
+        self.load()
+        return {"embedder": self.embedder.name, "dim": self.dim, "vectors": int(self.alive[: self.size].sum()), "rows": self.size}
+
+
+semantic_index = SemanticIndex()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import aiohttp
+from cache import MemoryStore, TieredCache, normalize_name, store
+from dotenv import load_dotenv
+from instrumentation import cache_total
+from scheduler import fetch
+from utils import random_headers, valid_affil, valid_names
+
+load_dotenv()
+
+SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+# Searches allowed per UTC day, cached responses don't count. 0 means no limit.
+SERPAPI_DAILY_BUDGET = int(os.getenv("SERPAPI_DAILY_BUDGET", 100))
+# Most articles pages of an author fetched, at ARTICLES_PER_PAGE each.
+SERPAPI_MAX_PAGES = int(os.getenv("SERPAPI_MAX_PAGES", 3))
+ARTICLES_PER_PAGE = 100
+
+# Seconds each kind of response is reused for. Profile ids don't change, and an author found
+# without a profile stays so for a while, so that queries for them don't keep spending searches.
+SEARCH_TTL = 7 * 24 * 3600
+AUTHOR_ID_TTL = 30 * 24 * 3600
+NO_PROFILE_TTL = 3 * 24 * 3600
+USAGE_TTL = 2 * 24 * 3600
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class SerpAPI(TieredCache):
+    """SerpAPI client spending as few paid searches as possible.
+
+    Responses are cached on their query parameters, in memory and in the persistent store, and the
+    profile resolved for an author is cached per (name, affiliation), so a repeated query costs
+    nothing and a failed one isn't retried right away. Searches beyond the daily budget raise
+    `QuotaExceeded` instead of being sent.
+    """
+
+    def __init__(self, key: str = SERPAPI_KEY, store=None, memory=None, budget: int = SERPAPI_DAILY_BUDGET):
+        super().__init__(store, memory if memory is not None else MemoryStore(1024))
+        self.key = key
+        self.budget = budget
+        self.hits = 0
+        self.calls = 0
+
+    @staticmethod
+    def usage_key() -> str:
+        return f"serpapi\0usage\0{datetime.now(timezone.utc).date().isoformat()}"
+
+    def usage(self) -> int:
+        """Searches sent today, by every process sharing the store."""
+        # Read past the memory tier, which only sees this process's searches.
+        tier = self.store if self.store is not None else self.memory
+        return tier.get(self.usage_key()) or 0
+
+    def spend(self):
+        used = self.usage()
+        if self.budget and used >= self.budget:
+            raise QuotaExceeded(f"SerpAPI daily budget of {self.budget} searches used up")
+        (self.store if self.store is not None else self.memory).set(self.usage_key(), used + 1, USAGE_TTL)
+        self.calls += 1
+
+    async def search(self, session: aiohttp.ClientSession, params: dict, ttl: float = SEARCH_TTL) -> dict:
+        """Response of a SerpAPI search, or None if it failed. Successful responses and searches without results are cached."""
+        key = "serpapi\0" + hashlib.sha1(urlencode(sorted(params.items())).encode()).hexdigest()
+        if (cached := self.lookup(key)) is not None:
+            self.hits += 1
+            cache_total.labels(cache="serpapi", result="hit").inc()
+            return cached
+        cache_total.labels(cache="serpapi", result="miss").inc()
+
+        self.spend()
+        url = "https://serpapi.com/search.json?" + urlencode(params | {"api_key": self.key})
+        async with fetch(session, url, headers=random_headers()) as response:
+            if response.status != 200:
+                return None
+            result = await response.json()
+        if error := result.get("error"):
+            # No results is reported as an error too, but it's an answer, and asking again costs another search.
+            if "hasn't returned any results" not in error:
+                return None
+            result, ttl = {}, min(ttl, NO_PROFILE_TTL)
+        self.save(key, result, ttl)
+        return result
+
+    async def author_id(self, session: aiohttp.ClientSession, author: str, affiliation: str = None) -> str:
+        """Scholar profile id of an author, the first profile matching the name and affiliation."""
+        key = "serpapi\0author_id\0" + normalize_name(author) + "\0" + normalize_name(affiliation or "")
+        if (cached := self.lookup(key)) is not None:
+            self.hits += 1
+            cache_total.labels(cache="serpapi", result="hit").inc()
+            return cached[0]
+
+        response = await self.search(session, {"engine": "google_scholar_profiles", "mauthors": author})
+        if response is None:
+            return None
+        author_id = None
+        profiles = response.get("profiles", [])
+        if affiliation:
+            for profile in profiles:
+                if valid_names([profile["name"]], author, 80) and valid_affil(affiliation, profile["affiliations"]):
+                    author_id = profile["author_id"]
+                    break
+        elif profiles and valid_names([profiles[0]["name"]], author, 80):
+            author_id = profiles[0]["author_id"]
+        # Wrapped in a list so that an author without a profile can be told apart from a cache miss.
+        self.save(key, [author_id], AUTHOR_ID_TTL if author_id else NO_PROFILE_TTL)
+        return author_id
+
+    async def author(self, session: aiohttp.ClientSession, author_id: str, max_pages: int = SERPAPI_MAX_PAGES) -> dict:
+        """Scholar profile of an author with every article in `articles`, or None.
+
+        Articles are requested 100 at a time, and further pages only while the previous one was full.
+        """
+        params = {"engine": "google_scholar_author", "author_id": author_id, "num": ARTICLES_PER_PAGE}
+        if (response := await self.search(session, params)) is None:
+            return None
+        articles = list(response.get("articles", []))
+        page = response
+        for start in range(ARTICLES_PER_PAGE, ARTICLES_PER_PAGE * max_pages, ARTICLES_PER_PAGE):
+            if len(page.get("articles", [])) < ARTICLES_PER_PAGE or "next" not in page.get("serpapi_pagination", {}):
+                break
+            if (page := await self.search(session, params | {"start": start})) is None:
+                break
+            articles += page.get("articles", [])
+        return response | {"articles": articles}
+
+    def stats(self) -> dict:
+        return {"used_today": self.usage(), "budget": self.budget, "calls": self.calls, "cache_hits": self.hits}
+
+
+serpapi = SerpAPI(store=store)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+
+from cache import MemoryStore, TieredCache, store
+from dedup import normalize_title
+from dotenv import load_dotenv
+from publication import Publication
+
+load_dotenv()
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama3-8b-8192")
+# Prompt budget in tokens, leaving room in the model's 8k context for the instructions and the answer.
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 5000))
+# Longest a single publication may get in a prompt, so that one huge abstract can't fill a chunk.
+PUBLICATION_TOKENS = 400
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 4))
+# Most times partial summaries are summarized again before being cut down to fit the final prompt.
+MAX_REDUCE_ROUNDS = 3
+# Summaries are keyed on their publications, so they never go stale; the TTL only bounds the store.
+SUMMARY_TTL = 30 * 24 * 3600
+
+TEMPLATE = (
+    "Please generate a summary of the author's research work based on these publications. Follow this template:\n"
+    "1. **Introduction:** Briefly introduce the author's research area.\n"
+    "2. **Key Contributions:** Highlight the major contributions or findings from the publications.\n"
+    "3. **Research Focus:** Describe the specific area or field of research the author is known for.\n"
+    "4. **Overall Impact:** Summarize the significance or impact of the author's work.\n"
+    "Provide the summary in a structured format following the above points."
+)
+SUMMARY_PROMPT = "Here is a list of publications by an author:\n\n{publications}\n\n" + TEMPLATE
+MAP_PROMPT = (
+    "Here is part of the list of publications by an author:\n\n{publications}\n\n"
+    "Summarize the research topics, methods and main findings of these publications in one paragraph."
+)
+REDUCE_PROMPT = "Here are summaries of different parts of an author's publication list:\n\n{publications}\n\n" + TEMPLATE
+
+
+def tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text, close enough for budgeting.
+    return len(text) // 4 + 1
+
+
+def truncate(text: str, limit: int) -> str:
+    if tokens(text) <= limit:
+        return text
+    return text[: limit * 4].rsplit(" ", 1)[0] + " ..."
+
+
+def entry(publication: Publication) -> str:
+    text = f"Title: {publication.title}\n"
+    if publication.abstract:
+        text += f"Abstract: {publication.abstract.strip()}\n"
+    return truncate(text, PUBLICATION_TOKENS)
+
+
+def chunks(texts: list[str], budget: int) -> list[str]:
+    """Pack texts in order into as few chunks of at most `budget` tokens as possible."""
+    result, current, size = [], [], 0
+    for text in texts:
+        if current and size + tokens(text) > budget:
+            result.append("\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += tokens(text)
+    if current:
+        result.append("\n".join(current))
+    return result
+
+
+class GroqClient:
+    def __init__(self, model: str = SUMMARY_MODEL):
+        from groq import AsyncGroq
+
+        self.model = model
+        self.client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+
+    async def complete(self, prompt: str) -> str:
+        chat_completion = await self.client.chat.completions.create(messages=[{"role": "user", "content": prompt}], model=self.model)
+        return chat_completion.choices[0].message.content
+
+
+class StubClient:
+    """Offline client answering with the titles in the prompt, for tests and benchmarks.
+
+    Like a model asked for a paragraph, it keeps its answer short: at most `lines` titles of a few
+    words each, so summaries of summaries shrink.
+    """
+
+    def __init__(self, delay: float = 0, lines: int = 20, words: int = 8):
+        self.delay = delay
+        self.lines = lines
+        self.words = words
+        self.calls = 0
+
+    async def complete(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        lines = [line for line in prompt.splitlines() if line.startswith(("Title: ", "- "))]
+        titles = [line.removeprefix("Title: ").removeprefix("- ").split()[: self.words] for line in lines[: self.lines]]
+        return "\n".join("- " + " ".join(title) for title in titles)
+
+
+def create_client():
+    if os.getenv("SUMMARY_CLIENT", "groq") == "stub":
+        return StubClient()
+    return GroqClient()
+
+
+class Summarizer(TieredCache):
+    """LLM summaries of an author's publications.
+
+    Summaries are cached on a hash of the deduplicated publications, so asking again for the same
+    set costs nothing, and concurrent requests for the same set share one generation. Publication
+    lists over the token budget are summarized chunk by chunk and the partial summaries combined
+    (map-reduce). At most `concurrency` LLM calls run at once across all authors.
+    """
+
+    def __init__(self, client=None, store=None, memory=None, budget: int = SUMMARY_TOKEN_BUDGET, concurrency: int = SUMMARY_CONCURRENCY):
+        super().__init__(store, memory if memory is not None else MemoryStore(256))
+        self.client = client
+        self.budget = budget
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.calls = 0
+
+    @staticmethod
+    def key(publications: list[Publication]) -> str:
+        items = sorted({(normalize_title(i.title), (i.abstract or "").strip()) for i in publications})
+        digest = hashlib.sha1()
+        for title, abstract in items:
+            digest.update(f"{title}\0{abstract}\0".encode())
+        return hashlib.sha1(f"summary\0{SUMMARY_MODEL}\0{digest.hexdigest()}".encode()).hexdigest()
+
+    async def complete(self, prompt: str) -> str:
+        if self.client is None:
+            self.client = create_client()
+        async with self.semaphore:
+            self.calls += 1
+            return await self.client.complete(prompt)
+
+    async def generate(self, publications: list[Publication]) -> str:
+        parts = chunks([entry(i) for i in publications], self.budget)
+        if len(parts) == 1:
+            return await self.complete(SUMMARY_PROMPT.format(publications=parts[0]))
+
+        partials = await asyncio.gather(*[self.complete(MAP_PROMPT.format(publications=part)) for part in parts])
+        # Partial summaries can themselves overflow the budget for very prolific authors. They're summarized
+        # again while that shrinks them, and whatever still overflows is cut down to an equal share of the budget.
+        for _ in range(MAX_REDUCE_ROUNDS):
+            if len(parts := chunks(partials, self.budget)) == 1:
+                break
+            size = sum(map(tokens, partials))
+            partials = await asyncio.gather(*[self.complete(MAP_PROMPT.format(publications=part)) for part in parts])
+            if sum(map(tokens, partials)) >= size:
+                break
+        if len(chunks(partials, self.budget)) > 1:
+            partials = [truncate(partial, max(self.budget // len(partials), 1)) for partial in partials]
+        return await self.complete(REDUCE_PROMPT.format(publications="\n".join(partials)))
+
+    async def summarize(self, publications: list[Publication]) -> str:
+        """Summary of an author's publications."""
+        publications = [i for i in publications if i.title]
+        if not publications:
+            return None
+
+        key = self.key(publications)
+        if (cached := self.lookup(key)) is not None:
+            self.hits += 1
+            return cached
+
+        if not (task := self.inflight.get(key)):
+            self.misses += 1
+            task = asyncio.create_task(self.generate(publications))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        summary = await asyncio.shield(task)
+        self.save(key, summary, SUMMARY_TTL)
+        return summary
+
+    async def summarize_many(self, authors: dict[str, list[Publication]]) -> dict[str, str]:
+        """Summaries of many authors at once, `{author: publications}` -> `{author: summary}`."""
+        summaries = await asyncio.gather(*[self.summarize(publications) for publications in authors.values()])
+        return dict(zip(authors, summaries))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "llm_calls": self.calls, "inflight": len(self.inflight), "memory_entries": len(self.memory)}
+
+
+summarizer = Summarizer(store=store)
@@ -1,10 +1,13 @@
 import random
 import re
+from functools import lru_cache
 
 import aiohttp
-from bs4 import BeautifulSoup
+import numpy as np
 from bs4.element import Tag
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+from parsers import parse, parse_abstract
 
 user_agents = [
     "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.1 (KHTML, like Gecko) Chrome/22.0.1207.1 Safari/537.1",
@@ -31,10 +34,6 @@ user_agents = [
 ]
 
 
-def to_dict(source, title, year, authors, link, abstract):
-    return {"source": source, "title": title, "year": year, "authors": authors, "link": link, "abstract": abstract}
-
-
 def random_headers():
     return {"User-Agent": random.choice(user_agents)}
 
@@ -64,22 +63,56 @@ def generate_variants(author: str) -> set[str]:
     return variants
 
 
+class NameMatcher:
+    """Fuzzy matcher for the name variants of one queried author.
+
+    Scores with rapidfuzz's C implementation of token_sort_ratio, rounded like fuzzywuzzy's. Names of
+    a whole result page can be scored in a single `process.cdist` call via `match_many`.
+    """
+
+    def __init__(self, author: str, ratio: int = 90):
+        self.ratio = ratio
+        self.variants = [default_process(i) for i in generate_variants(author)]
+
+    def scores(self, names: list[str]) -> np.ndarray:
+        names = [default_process(name.replace(".", "").replace(",", "")) for name in names]
+        return process.cdist(self.variants, names, scorer=fuzz.token_sort_ratio, dtype=np.float32)
+
+    def matches(self, names: list[str]) -> bool:
+        if not names:
+            return False
+        return bool((np.rint(self.scores(names)) >= self.ratio).any())
+
+    def match_many(self, groups: list[list[str]]) -> list[bool]:
+        """Whether each group of co-author names contains the author."""
+        names = [name for group in groups for name in group]
+        if not names:
+            return [False] * len(groups)
+        hits = (np.rint(self.scores(names)) >= self.ratio).any(axis=0)
+        bounds = np.cumsum([0] + [len(group) for group in groups])
+        return [bool(hits[start:end].any()) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+@lru_cache(maxsize=4096)
+def name_matcher(author: str, ratio: int = None) -> NameMatcher:
+    return NameMatcher(author, ratio or 90)
+
+
 def valid_name(variants, name, ratio=None):
     if not ratio:
         ratio = 90
     name = name.replace(".", "").replace(",", "").lower()
-    return any(fuzz.token_sort_ratio(i, name) >= ratio for i in variants)
+    return any(round(fuzz.token_sort_ratio(i, name, processor=default_process)) >= ratio for i in variants)
 
 
 def valid_names(names: list[str], author: str, ratio=None):
-    variants = generate_variants(author)
-    return any(valid_name(variants, name, ratio) for name in names)
+    return name_matcher(author, ratio).matches(names)
 
 
 def valid_affil(query, result):
     if query in result or result in query:
         return True
-    return fuzz.token_sort_ratio(result, query) >= 80
+    return round(fuzz.token_sort_ratio(result, query, processor=default_process)) >= 80
 
 
 def clean_abs(abstract: str):
@@ -177,6 +210,9 @@ async def abstract(session: aiohttp.ClientSession, url: str, source: str = None)
     Returns:
         str: Abstract text
     """
+    # Imported here, revalidation builds on cache, which imports this module.
+    from revalidation import revalidate
+
     if not source and not (source := extract_source(url)):
         return None
 
@@ -184,91 +220,18 @@ async def abstract(session: aiohttp.ClientSession, url: str, source: str = None)
     if source == "openreview":
         return None
 
-    async with session.get(url, headers=random_headers()) as response:
-        abstract = None
-
-        if response.status == 200:
-            # DOI redirects websites, so checking URL of response is necessary.
-            if source == "doi":
-                url = str(response.url)
-                if not (source := extract_source(url)):
-                    return None
-
-            elif source == "scholar":
-                response = await response.read()
-                soup = BeautifulSoup(response, "html.parser")
-                abstract = soup.find("div", {"class": "gsh_small"})
-
-            if source == "pubmed":
-                response = await response.text()
-                soup = BeautifulSoup(response, "lxml")
-                abstract = soup.find("div", id="abstract")
-
-            elif source == "arxiv":
-                response = await response.read()
-                soup = BeautifulSoup(response, features="xml")
-                abstract = soup.find("blockquote", {"class": "abstract mathjax"})
-
-            elif source == "acmdl":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("section", id="abstract")
-
-            elif source == "inspire":
-                res = await response.json()
-                abstract = res["metadata"]["abstracts"][0]["value"]
-
-            elif source == "biorxiv":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("div", {"class": "highwire-markup"})
-
-            elif source == "nature":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("div", {"id": "Abs1-content", "class": "c-article-section__content"})
-
-            elif source == "openreview":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("meta", {"name": "citation_abstract"}).get("content")
-
-            elif source == "jmlr":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("p", {"class": "abstract"})
-
-            elif source == "neurips":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                text = soup.find("div", {"class": "col"}).text
-                match = re.split(r"Abstract|abstract", text, maxsplit=1)
-                abstract = match[1] if len(match) == 2 else None
-
-            elif source == "mdpi":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                abstract = soup.find("section", {"class": "html-abstract"})
-
-            elif source == "ieee":
-                res = await response.text()
-                soup = BeautifulSoup(res, "lxml")
-                content = soup.select_one('meta[property="og:description"]')
-                if content and "content" in content:
-                    soup = BeautifulSoup(content["content"], "lxml")
-                    abstract = soup.get_text(separator=" ", strip=True)
-
-            elif source == "frontiers":
-                res = await response.read()
-                soup = BeautifulSoup(res, "lxml")
-                soup = soup.find("div", {"class": "JournalFullText"})
-                abstract = soup.find("div", {"class": "JournalAbstract"})
-
-                if authors := abstract.find("div", {"class": "authors"}):
-                    authors.decompose()
-                if notes := abstract.find("ul", {"class": "notes"}):
-                    notes.decompose()
-
-            if abstract:
-                return clean_abs(abstract)
-    return None
+    async def read(response):
+        # DOI redirects websites, so checking URL of response is necessary.
+        target = extract_source(str(response.url)) if source == "doi" else source
+        return [target, await response.read() if target else None]
+
+    async def extract(page):
+        target, raw = page
+        if not target:
+            return None
+        abstract = await parse(parse_abstract, target, raw)
+        if abstract:
+            return clean_abs(abstract)
+        return None
+
+    return await revalidate(session, url, "abstract", read=read, parse=extract, headers=random_headers())